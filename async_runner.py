@@ -0,0 +1,20 @@
+"""异步入口运行工具
+
+供 main.py、demo.py 和 multihop_dataset_builder.py 的 __main__ 统一运行异步主函数
+"""
+
+import asyncio
+from typing import Any, Coroutine
+
+try:
+    import uvloop
+except ImportError:
+    # 未安装或Windows平台时使用默认事件循环
+    uvloop = None
+
+
+def run_async(main: Coroutine[Any, Any, Any]) -> Any:
+    """运行异步主函数，优先使用uvloop事件循环"""
+    if uvloop is not None and hasattr(uvloop, 'run'):
+        return uvloop.run(main)
+    return asyncio.run(main)
@@ -16,16 +16,42 @@ AgenticX GraphRAG 演示系统主程序
 import absl.logging
 absl.logging.set_verbosity('info')
 
+import re
 import sys
+import json
 import yaml
+import heapq
+import hashlib
 import asyncio
 import warnings
 import time
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterator
+from collections import Counter
 from datetime import datetime, timezone
 from loguru import logger
 
+try:
+    import orjson
+except ImportError:
+    # 未安装orjson时回退到标准json
+    orjson = None
+
+# 优先使用 libyaml 的C实现解析配置
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+try:
+    import msgpack
+except ImportError:
+    # 未安装msgpack时键值数据使用JSON编码
+    msgpack = None
+
+try:
+    import numpy as np
+except ImportError:
+    # 未安装numpy时无法进行向量精度压缩，保持float32列表
+    np = None
+
 # 导入 Rich 美化库
 try:
     from rich.console import Console
@@ -127,6 +153,103 @@ from agenticx.llms import LlmFactory
 
 # 导入本地模块
 from prompt_manager import PromptManager
+from async_runner import run_async
+
+# 向量批量写入的默认分块大小
+VECTOR_INSERT_BATCH_SIZE = 512
+# 单条检索结果写入提示词上下文的最大字符数，0 表示不截断（默认保留完整内容）
+MAX_SNIPPET_LENGTH = 0
+
+# SPO 分片条目格式版本，写入键名前缀；条目格式变化时递增，读取方不会拿到旧格式的数据
+# v2: 条目为定长元组（字段顺序见 SPO_ENTRY_FIELDS），v1 为字典
+SPO_INDEX_VERSION = 2
+# SPO 索引分片键前缀：每个主语/谓语/宾语单独存为一个键
+SPO_SHARD_PREFIXES = {
+    'subject_index': f'spo:v{SPO_INDEX_VERSION}:s:',
+    'predicate_index': f'spo:v{SPO_INDEX_VERSION}:p:',
+    'object_index': f'spo:v{SPO_INDEX_VERSION}:o:'
+}
+# SPO 清单键，记录上次构建的分片名称，用于清理已不存在的分片
+SPO_MANIFEST_KEY = f'spo:v{SPO_INDEX_VERSION}:manifest'
+# 直接实体搜索时每个实体最多展示的关系数
+MAX_SPO_RELATIONS_DISPLAYED = 10
+# SPO 索引条目为定长元组，各索引的字段顺序
+SPO_ENTRY_FIELDS = {
+    'subject_index': ('predicate', 'object', 'relationship_id'),
+    'predicate_index': ('subject', 'object', 'relationship_id'),
+    'object_index': ('subject', 'predicate', 'relationship_id')
+}
+# 键值数据的msgpack编码版本，写入键名前缀，与JSON编码的旧数据互不覆盖
+KV_MSGPACK_VERSION = 2
+
+# 实体名称全文索引（替代逐行正则匹配的全量扫描）
+ENTITY_FULLTEXT_INDEX = 'entityNameIndex'
+CREATE_ENTITY_FULLTEXT_INDEX_QUERY = (
+    f"CREATE FULLTEXT INDEX {ENTITY_FULLTEXT_INDEX} IF NOT EXISTS "
+    "FOR (n:Entity) ON EACH [n.name, n.description]"
+)
+ENTITY_FULLTEXT_SEARCH_QUERY = f"""
+CALL db.index.fulltext.queryNodes('{ENTITY_FULLTEXT_INDEX}', $entity_name) YIELD node, score
+RETURN node.name as name, node.description as description, labels(node) as type
+LIMIT 5
+"""
+# 全文索引不可用时的回退查询（不含正则分支）
+ENTITY_CONTAINS_SEARCH_QUERY = """
+MATCH (n:Entity)
+WHERE toLower(n.name) CONTAINS toLower($entity_name)
+RETURN n.name as name, n.description as description, labels(n) as type
+LIMIT 5
+"""
+_LUCENE_SPECIAL_RE = re.compile(r'([+\-!(){}\[\]^"~*?:\\/&|])')
+
+
+def _json_dumps(obj: Any) -> str:
+    """序列化为JSON字符串（优先使用orjson）"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def _kv_key(key: str, kv_format: str) -> str:
+    """按编码格式生成键名，msgpack数据带版本前缀"""
+    if kv_format == 'msgpack':
+        return f"v{KV_MSGPACK_VERSION}:{key}"
+    return key
+
+
+def _kv_encode(obj: Any, kv_format: str):
+    """按编码格式序列化键值数据"""
+    if kv_format == 'msgpack':
+        return msgpack.packb(obj, use_bin_type=True)
+    return _json_dumps(obj)
+
+
+def _kv_decode(raw, kv_format: str) -> Any:
+    """按编码格式反序列化键值数据"""
+    if kv_format == 'msgpack':
+        return msgpack.unpackb(raw, raw=False)
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+# 支持的文档文件类型（小写扩展名，含点号）
+SUPPORTED_EXTENSIONS = frozenset({'.pdf', '.txt', '.json', '.csv', '.md', '.doc', '.docx', '.ppt', '.pptx'})
+
+
+def _iter_files(root: Path, extensions) -> Iterator[Path]:
+    """单次遍历目录树（os.scandir + 显式栈），返回扩展名在 extensions 中的文件
+    
+    不进入符号链接目录，遍历顺序与 Path.rglob('*') 一致。
+    """
+    stack = [os.fspath(root)]
+    while stack:
+        subdirs = []
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in extensions:
+                    yield Path(entry.path)
+        stack.extend(reversed(subdirs))
 
 # 创建 Rich Console 实例
 console = Console() if Console else None
@@ -340,23 +463,25 @@ def scan_data_directories() -> Dict[str, List[Dict[str, Any]]]:
         dir_path = Path(data_dir)
         if dir_path.exists():
             files = []
-            for file_path in dir_path.iterdir():
-                if file_path.is_file():
-                    stat = file_path.stat()
-                    files.append({
-                        "name": file_path.name,
-                        "path": str(file_path),
-                        "size": stat.st_size,
-                        "size_mb": round(stat.st_size / (1024 * 1024), 2),
-                        "type": file_path.suffix.lower(),
-                        "modified": datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M")
-                    })
+            # scandir 的 DirEntry 自带文件类型信息，判断文件类型无需额外的 stat 调用
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        files.append({
+                            "name": entry.name,
+                            "path": str(dir_path / entry.name),
+                            "size": stat.st_size,
+                            "size_mb": round(stat.st_size / (1024 * 1024), 2),
+                            "type": os.path.splitext(entry.name)[1].lower(),
+                            "modified": datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M")
+                        })
             file_info[data_dir] = files
     
     return file_info
 
-def display_data_selection() -> str:
-    """显示数据目录选择界面"""
+async def display_data_selection() -> str:
+    """显示数据目录选择界面（输入在后台线程中读取，不阻塞事件循环）"""
     file_info = scan_data_directories()
     
     if console and Table and box:
@@ -413,7 +538,8 @@ def display_data_selection() -> str:
     # 多个目录时让用户选择
     if console and Prompt:
         choices = "/".join(available_dirs)
-        selected = Prompt.ask(
+        selected = await asyncio.to_thread(
+            Prompt.ask,
             f"请选择文档目录 ({choices})",
             choices=available_dirs,
             default=available_dirs[0]
@@ -422,15 +548,15 @@ def display_data_selection() -> str:
     else:
         print(f"可用目录: {', '.join(available_dirs)}")
         while True:
-            choice = input(f"请选择目录 ({'/'.join(available_dirs)}): ").strip()
+            choice = (await asyncio.to_thread(input, f"请选择目录 ({'/'.join(available_dirs)}): ")).strip()
             if choice in available_dirs:
                 return choice
             elif not choice and available_dirs:
                 return available_dirs[0]
             print("无效选择，请重新输入")
 
-def select_run_mode() -> str:
-    """选择运行模式"""
+async def select_run_mode() -> str:
+    """选择运行模式（输入在后台线程中读取，不阻塞事件循环）"""
     if console and Panel and Text and box:
         mode_text = Text()
         mode_text.append("1. Full Mode", style="bold green")
@@ -487,7 +613,8 @@ def select_run_mode() -> str:
     mode_map = {"1": "full", "2": "build", "3": "qa"}
     
     if console and Prompt:
-        choice = Prompt.ask(
+        choice = await asyncio.to_thread(
+            Prompt.ask,
             "请选择模式",
             choices=["1", "2", "3"],
             default="1"
@@ -496,15 +623,11 @@ def select_run_mode() -> str:
     else:
         while True:
             try:
-                choice = input("\n请选择模式 (1-3): ").strip()
-                if choice == '' or choice == '1':
-                    return 'full'
-                elif choice == '2':
-                    return 'build'
-                elif choice == '3':
-                    return 'qa'
-                else:
-                    print("请输入 1、2 或 3")
+                choice = (await asyncio.to_thread(input, "\n请选择模式 (1-3): ")).strip() or "1"
+                mode = mode_map.get(choice)
+                if mode is not None:
+                    return mode
+                print("请输入 1、2 或 3")
             except (EOFError, KeyboardInterrupt):
                 return 'full'
 
@@ -526,6 +649,18 @@ class AgenticXGraphRAGDemo:
         self.knowledge_graph = None
         self.retriever = None
         
+        # 向量写入进度回调：callback(label, inserted_count)
+        self.vector_progress_callback = None
+        
+        # 嵌入缓存（按文本内容哈希索引，延迟加载）
+        self._embedding_cache = None
+        self._embedding_cache_dirty = False
+        # 本次构建用到的缓存键，保存时剔除其余条目
+        self._embedding_cache_used = set()
+        
+        # 两端实体都存在的有效关系（store_and_index 中计算一次，供各索引构建共享）
+        self._valid_relationships = None
+        
         # 提示词管理器
         self.prompt_manager = PromptManager("prompts")
         
@@ -546,7 +681,7 @@ class AgenticXGraphRAGDemo:
             raise FileNotFoundError(f"配置文件未找到: {self.config_path}")
             
         with open(config_file, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
+            config = yaml.load(f, Loader=_YAML_LOADER)
             
         # 环境变量替换
         self._replace_env_vars(config)
@@ -618,8 +753,22 @@ class AgenticXGraphRAGDemo:
         # 4. 初始化检索器
         await self._initialize_retriever()
         
+        # 5. 确保实体名称全文索引存在
+        self._ensure_entity_fulltext_index()
+        
         self.logger.info("系统组件初始化完成")
     
+    def _ensure_entity_fulltext_index(self) -> None:
+        """创建实体名称全文索引（已存在时跳过）"""
+        try:
+            from agenticx.storage import StorageType
+            graph_storage = self.storage_manager.get_storage(StorageType.NEO4J)
+            if graph_storage:
+                graph_storage.execute_query(CREATE_ENTITY_FULLTEXT_INDEX_QUERY)
+                self.logger.debug(f"实体全文索引已就绪: {ENTITY_FULLTEXT_INDEX}")
+        except Exception as e:
+            self.logger.warning(f"⚠️ 实体全文索引创建失败，实体搜索将回退到CONTAINS匹配: {e}")
+    
     async def _initialize_llm(self) -> None:
         """初始化 LLM 客户端"""
         from agenticx.knowledge.graphers.config import LLMConfig
@@ -948,17 +1097,11 @@ class AgenticXGraphRAGDemo:
         if not self.data_dir.exists():
             raise FileNotFoundError(f"数据目录不存在: {self.data_dir}")
         
-        # 支持的文件类型
-        supported_extensions = {'.pdf', '.txt', '.json', '.csv', '.md', '.doc', '.docx', '.ppt', '.pptx'}
-        
-        # 扫描文件
-        files = []
-        for file_path in self.data_dir.rglob('*'):
-            if file_path.is_file() and file_path.suffix.lower() in supported_extensions:
-                files.append(file_path)
+        # 单次遍历扫描文件
+        files = list(_iter_files(self.data_dir, SUPPORTED_EXTENSIONS))
         
         if not files:
-            raise ValueError(f"数据目录中没有找到支持的文件类型: {supported_extensions}")
+            raise ValueError(f"数据目录中没有找到支持的文件类型: {sorted(SUPPORTED_EXTENSIONS)}")
         
         self.logger.info(f"找到 {len(files)} 个文件: {[f.name for f in files]}")
         return files
@@ -1182,6 +1325,12 @@ class AgenticXGraphRAGDemo:
         relation_count = len(self.knowledge_graph.relationships)
         self.logger.info(f"输入数据: {entity_count}个实体, {relation_count}个关系")
         
+        # 预先筛选有效关系，向量索引和SPO索引共享同一份结果
+        self._valid_relationships = None
+        valid_relationships = self._get_valid_relationships()
+        if len(valid_relationships) < relation_count:
+            self.logger.info(f"过滤悬空关系: {relation_count - len(valid_relationships)}个")
+        
         # 1. 存储到图数据库
         try:
             graph_storage = await self.storage_manager.get_graph_storage('default')
@@ -1197,29 +1346,26 @@ class AgenticXGraphRAGDemo:
             self.logger.error(f"❌ 图数据库存储失败: {e}")
             self.logger.warning("继续执行其他索引步骤")
         
-        # 2. 构建向量索引
-        try:
-            await self._build_vector_index()
-        except Exception as e:
-            self.logger.error(f"❌ 向量索引构建失败: {e}")
-        
-        # 3. 构建BM25索引
+        # 2. 构建BM25索引
         try:
             await self._build_bm25_index()
         except Exception as e:
             self.logger.error(f"❌ BM25索引构建失败: {e}")
         
-        # 4. 构建 SPO 索引
-        try:
-            await self._build_spo_index()
-        except Exception as e:
-            self.logger.error(f"❌ SPO索引构建失败: {e}")
-        
-        # 5. 缓存关键数据
-        try:
-            await self._cache_key_data()
-        except Exception as e:
-            self.logger.error(f"❌ 数据缓存失败: {e}")
+        # 3. 并发构建向量索引、SPO索引并缓存关键数据
+        # 三者写入互不相关的存储（向量库 / KV-SPO / KV-统计），等待嵌入API时可同时完成SPO构建和统计缓存
+        phases = [
+            ("向量索引构建", self._build_vector_index()),
+            ("SPO索引构建", self._build_spo_index()),
+            ("数据缓存", self._cache_key_data()),
+        ]
+        results = await asyncio.gather(*(coro for _, coro in phases), return_exceptions=True)
+        for (phase_name, _), result in zip(phases, results):
+            if isinstance(result, Exception):
+                self.logger.error(f"❌ {phase_name}失败: {result}")
+        
+        # 4. 持久化嵌入缓存，供下次增量索引复用
+        self._save_embedding_cache()
         
         # 统计向量索引总数 - 统计所有独立向量存储实例
         total_vectors = 0
@@ -1309,7 +1455,10 @@ class AgenticXGraphRAGDemo:
         )
         vector_chunker = get_chunker(vector_chunking_config['strategy'], vector_config)
         
+        # 分块流式写入，避免一次性持有全部向量记录
+        insert_batch_size = self.config['storage']['vector'].get('insert_batch_size', VECTOR_INSERT_BATCH_SIZE)
         document_records = []
+        inserted_count = 0
         for doc_idx, document in enumerate(self.documents):
             # 使用向量检索专用分块
             try:
@@ -1337,12 +1486,12 @@ class AgenticXGraphRAGDemo:
             
             for chunk_idx, chunk in enumerate(chunks):
                 # 生成嵌入
-                embedding = await self.embedding_router.aembed_text(chunk.content)
+                embedding = await self._embed_text(chunk.content)
                 
                 # 创建向量记录
                 record = VectorRecord(
                     id=f"doc_{doc_idx}_chunk_{chunk_idx}",
-                    vector=embedding,
+                    vector=self._quantize_vector(embedding),
                     payload={
                         'content': chunk.content,  # 🔧 修复：将content放到payload中
                         'metadata': {
@@ -1356,11 +1505,18 @@ class AgenticXGraphRAGDemo:
                     }
                 )
                 document_records.append(record)
+                if len(document_records) >= insert_batch_size:
+                    inserted_count = await self._flush_vector_records(
+                        self._document_vector_storage, document_records, "文档向量", inserted_count
+                    )
         
-        # 批量存储文档分块向量
-        if document_records:
-            await self._document_vector_storage.add(document_records)
-            self.logger.info(f"✅ 文档向量索引完成: {len(document_records)}条记录")
+        # 写入剩余的文档分块向量
+        inserted_count = await self._flush_vector_records(
+            self._document_vector_storage, document_records, "文档向量", inserted_count
+        )
+        await self._finish_bulk_load(self._document_vector_storage)
+        if inserted_count:
+            self.logger.info(f"✅ 文档向量索引完成: {inserted_count}条记录")
             self.logger.info(f"📄 存储到集合: {storage_config['collection_name']}")
         else:
             self.logger.warning("❌ 没有文档分块可以索引")
@@ -1526,15 +1682,19 @@ class AgenticXGraphRAGDemo:
             if not vector_storage:
                 return
         
+        insert_batch_size = self.config['storage']['vector'].get('insert_batch_size', VECTOR_INSERT_BATCH_SIZE)
+        buffer = []
+        inserted_count = 0
+        
         # 为实体构建向量索引
-        entity_records = []
+        entity_count = 0
         for entity in self.knowledge_graph.entities.values():
             entity_text = f"{entity.name}: {entity.description or ''}"
-            embedding = await self.embedding_router.aembed_text(entity_text)
+            embedding = await self._embed_text(entity_text)
             
             record = VectorRecord(
                 id=f"legacy_entity_{entity.id}",
-                vector=embedding,
+                vector=self._quantize_vector(embedding),
                 metadata={
                     'type': 'legacy_entity',
                     'entity_type': entity.entity_type.value,
@@ -1543,41 +1703,176 @@ class AgenticXGraphRAGDemo:
                 },
                 content=entity_text
             )
-            entity_records.append(record)
+            buffer.append(record)
+            entity_count += 1
+            if len(buffer) >= insert_batch_size:
+                inserted_count = await self._flush_vector_records(vector_storage, buffer, "传统向量", inserted_count)
         
         # 为关系构建向量索引
-        relationship_records = []
-        for relationship in self.knowledge_graph.relationships.values():
-            source_entity = self.knowledge_graph.get_entity(relationship.source_entity_id)
-            target_entity = self.knowledge_graph.get_entity(relationship.target_entity_id)
-            
-            if source_entity and target_entity:
-                rel_text = f"{source_entity.name} {relationship.relation_type.value} {target_entity.name}"
-                embedding = await self.embedding_router.aembed_text(rel_text)
-                
-                record = VectorRecord(
-                    id=f"legacy_relation_{relationship.id}",
-                    vector=embedding,
-                    metadata={
-                        'type': 'legacy_relationship',
-                        'relation_type': relationship.relation_type.value,
-                        'source_entity': source_entity.name,
-                        'target_entity': target_entity.name,
-                        'confidence': relationship.confidence
-                    },
-                    content=rel_text
-                )
-                relationship_records.append(record)
+        relationship_count = 0
+        entities = self.knowledge_graph.entities
+        for relationship in self._get_valid_relationships():
+            source_entity = entities[relationship.source_entity_id]
+            target_entity = entities[relationship.target_entity_id]
+            
+            relation_type = relationship.relation_type.value
+            rel_text = f"{source_entity.name} {relation_type} {target_entity.name}"
+            embedding = await self._embed_text(rel_text)
+            
+            record = VectorRecord(
+                id=f"legacy_relation_{relationship.id}",
+                vector=self._quantize_vector(embedding),
+                metadata={
+                    'type': 'legacy_relationship',
+                    'relation_type': relation_type,
+                    'source_entity': source_entity.name,
+                    'target_entity': target_entity.name,
+                    'confidence': relationship.confidence
+                },
+                content=rel_text
+            )
+            buffer.append(record)
+            relationship_count += 1
+            if len(buffer) >= insert_batch_size:
+                inserted_count = await self._flush_vector_records(vector_storage, buffer, "传统向量", inserted_count)
+        
+        # 写入剩余记录
+        inserted_count = await self._flush_vector_records(vector_storage, buffer, "传统向量", inserted_count)
+        await self._finish_bulk_load(vector_storage)
+        if inserted_count:
+            self.logger.debug(f"传统向量索引: {entity_count}个实体 + {relationship_count}个关系")
+    
+    def _embedding_cache_config(self) -> Dict[str, Any]:
+        """获取嵌入缓存配置"""
+        return self.config.get('embeddings', {}).get('cache', {})
+    
+    def _embedding_cache_path(self) -> Path:
+        """嵌入缓存文件路径（numpy .npz 格式）"""
+        return Path(self._embedding_cache_config().get('path', './workspace/cache/embedding_cache.npz'))
+    
+    def _load_embedding_cache(self) -> Dict[int, List[float]]:
+        """加载持久化的嵌入缓存（numpy数组文件，禁止反序列化任意对象）"""
+        if not self._embedding_cache_config().get('enabled', True):
+            return {}
+        if np is None:
+            self.logger.warning("⚠️ 未安装numpy，嵌入缓存不持久化到磁盘")
+            return {}
+        cache_path = self._embedding_cache_path()
+        if not cache_path.exists():
+            return {}
+        try:
+            with np.load(cache_path, allow_pickle=False) as data:
+                cache = dict(zip(data['keys'].tolist(), data['vectors'].tolist()))
+            self.logger.info(f"加载嵌入缓存: {len(cache)}条")
+            return cache
+        except Exception as e:
+            self.logger.warning(f"嵌入缓存加载失败，将重新生成: {e}")
+            return {}
+    
+    def _save_embedding_cache(self) -> None:
+        """持久化嵌入缓存
         
-        # 批量存储
-        all_records = entity_records + relationship_records
-        if all_records:
-            vector_storage.add(all_records)
-            self.logger.debug(f"传统向量索引: {len(entity_records)}个实体 + {len(relationship_records)}个关系")
+        只保留本次构建用到的条目，避免缓存随多次构建无限增长；先写临时文件再原子替换，中断时不会损坏已有缓存。
+        """
+        if not self._embedding_cache:
+            return
+        # 剔除本次构建未使用的条目
+        if len(self._embedding_cache_used) < len(self._embedding_cache):
+            self._embedding_cache = {key: self._embedding_cache[key] for key in self._embedding_cache_used}
+            self._embedding_cache_dirty = True
+        if not self._embedding_cache_dirty or not self._embedding_cache:
+            return
+        if not self._embedding_cache_config().get('enabled', True) or np is None:
+            return
+        cache_path = self._embedding_cache_path()
+        tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+        try:
+            keys = np.fromiter(self._embedding_cache.keys(), dtype=np.uint64, count=len(self._embedding_cache))
+            vectors = np.asarray(list(self._embedding_cache.values()), dtype=np.float32)
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, keys=keys, vectors=vectors)
+            os.replace(tmp_path, cache_path)
+            self._embedding_cache_dirty = False
+            self.logger.info(f"嵌入缓存已保存: {len(self._embedding_cache)}条")
+        except Exception as e:
+            self.logger.warning(f"嵌入缓存保存失败: {e}")
+            tmp_path.unlink(missing_ok=True)
+    
+    def _embedding_cache_key(self, text: str) -> int:
+        """嵌入缓存键：嵌入模型 + 文本内容的64位哈希，模型变化时缓存自动失效"""
+        embed_config = self.config.get('embeddings', {})
+        provider = embed_config.get('router', {}).get('primary_provider', '')
+        provider_config = embed_config.get(provider, {})
+        namespace = f"{provider}:{provider_config.get('model', '')}:{provider_config.get('dimensions', '')}"
+        digest = hashlib.blake2b(f"{namespace}|{text}".encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big')
+    
+    async def _embed_text(self, text: str) -> List[float]:
+        """生成文本嵌入，命中缓存时跳过嵌入API调用
+        
+        内存去重始终生效（重复的实体/关系文本只嵌入一次），cache.enabled 仅控制磁盘持久化。
+        """
+        if self._embedding_cache is None:
+            self._embedding_cache = self._load_embedding_cache()
+        
+        key = self._embedding_cache_key(text)
+        self._embedding_cache_used.add(key)
+        embedding = self._embedding_cache.get(key)
+        if embedding is None:
+            embedding = await self.embedding_router.aembed_text(text)
+            self._embedding_cache[key] = embedding
+            self._embedding_cache_dirty = True
+        return embedding
+    
+    def _quantize_vector(self, embedding: List[float]):
+        """按配置压缩向量精度（float16可将向量内存和传输量减半）"""
+        vector_dtype = self.config['storage']['vector'].get('vector_dtype', 'float32')
+        if vector_dtype != 'float16':
+            return embedding
+        if np is None:
+            self.logger.warning("⚠️ 未安装numpy，vector_dtype=float16 不生效，保持float32")
+            self.config['storage']['vector']['vector_dtype'] = 'float32'
+            return embedding
+        return np.asarray(embedding, dtype=np.float16)
+    
+    async def _flush_vector_records(self, vector_storage, buffer: List[VectorRecord], label: str, inserted_count: int) -> int:
+        """将缓冲区中的向量记录写入存储并清空缓冲区，返回累计写入数量"""
+        if not buffer:
+            return inserted_count
+        
+        batch = list(buffer)
+        buffer.clear()
+        
+        # 异步存储直接等待，同步存储放到线程池中执行，避免阻塞事件循环
+        if asyncio.iscoroutinefunction(vector_storage.add):
+            await vector_storage.add(batch)
+        else:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, vector_storage.add, batch)
+        
+        inserted_count += len(batch)
+        self.logger.debug(f"{label}写入进度: {inserted_count}条记录")
+        if self.vector_progress_callback:
+            self.vector_progress_callback(label, inserted_count)
+        return inserted_count
+    
+    async def _finish_bulk_load(self, vector_storage) -> None:
+        """批量导入完成后统一flush一次，由存储端封存段并构建索引"""
+        if not self.config['storage']['vector'].get('defer_indexing', True):
+            return
+        collection = getattr(vector_storage, 'collection', None)
+        if collection is None or not hasattr(collection, 'flush'):
+            return
+        try:
+            # Milvus flush 为阻塞调用，放到线程中执行以免阻塞事件循环
+            await asyncio.to_thread(collection.flush)
+            self.logger.debug(f"{type(vector_storage).__name__}: 批量导入完成，已统一flush")
+        except Exception as e:
+            self.logger.warning(f"批量导入后flush失败: {e}")
     
     async def _build_spo_index(self) -> None:
         """构建 SPO 三元组索引"""
-        import json
         self.logger.info("构建 SPO 三元组索引...")
         
         # 调试：检查存储管理器状态
@@ -1591,51 +1886,53 @@ class AgenticXGraphRAGDemo:
             self.logger.warning("⚠️ 未找到键值存储，跳过SPO索引构建")
             return
         
-        # 构建 SPO 索引
+        # 构建 SPO 索引，条目为定长元组，字段顺序见 SPO_ENTRY_FIELDS
+        subject_index = {}  # 主语索引
+        predicate_index = {}  # 谓语索引
+        object_index = {}  # 宾语索引
         spo_index = {
-            'subject_index': {},  # 主语索引
-            'predicate_index': {},  # 谓语索引
-            'object_index': {}  # 宾语索引
+            'subject_index': subject_index,
+            'predicate_index': predicate_index,
+            'object_index': object_index
         }
         
-        for relationship in self.knowledge_graph.relationships.values():
-            source_entity = self.knowledge_graph.get_entity(relationship.source_entity_id)
-            target_entity = self.knowledge_graph.get_entity(relationship.target_entity_id)
-            
-            if source_entity and target_entity:
-                subject = source_entity.name
-                predicate = relationship.relation_type.value
-                object_name = target_entity.name
-                
-                # 主语索引
-                if subject not in spo_index['subject_index']:
-                    spo_index['subject_index'][subject] = []
-                spo_index['subject_index'][subject].append({
-                    'predicate': predicate,
-                    'object': object_name,
-                    'relationship_id': relationship.id
-                })
-                
-                # 谓语索引
-                if predicate not in spo_index['predicate_index']:
-                    spo_index['predicate_index'][predicate] = []
-                spo_index['predicate_index'][predicate].append({
-                    'subject': subject,
-                    'object': object_name,
-                    'relationship_id': relationship.id
-                })
-                
-                # 宾语索引
-                if object_name not in spo_index['object_index']:
-                    spo_index['object_index'][object_name] = []
-                spo_index['object_index'][object_name].append({
-                    'subject': subject,
-                    'predicate': predicate,
-                    'relationship_id': relationship.id
-                })
-        
-        # 存储索引（序列化为JSON）
-        kv_storage.set('spo_index', json.dumps(spo_index, ensure_ascii=False))
+        # 热循环中预先绑定方法引用
+        subject_setdefault = subject_index.setdefault
+        predicate_setdefault = predicate_index.setdefault
+        object_setdefault = object_index.setdefault
+        
+        entities = self.knowledge_graph.entities
+        for relationship in self._get_valid_relationships():
+            subject = entities[relationship.source_entity_id].name
+            predicate = relationship.relation_type.value
+            object_name = entities[relationship.target_entity_id].name
+            relationship_id = relationship.id
+            
+            subject_setdefault(subject, []).append((predicate, object_name, relationship_id))
+            predicate_setdefault(predicate, []).append((subject, object_name, relationship_id))
+            object_setdefault(object_name, []).append((subject, predicate, relationship_id))
+        
+        # 分片存储索引：查询时只需读取相关的键，无需解析整个索引
+        kv_format = self._kv_format()
+        kv_items = {}
+        for index_name, index in spo_index.items():
+            prefix = SPO_SHARD_PREFIXES[index_name]
+            for name, entries in index.items():
+                kv_items[_kv_key(f"{prefix}{name}", kv_format)] = _kv_encode(entries, kv_format)
+        
+        # 清单键记录本次构建的分片名称，写入前先据上次清单找出已不存在的分片
+        manifest = {index_name: list(index) for index_name, index in spo_index.items()}
+        stale_keys = self._stale_spo_keys(kv_storage, manifest, kv_format)
+        # 旧版本写入的单键整体索引已被分片取代
+        if kv_storage.exists('spo_index'):
+            stale_keys.append('spo_index')
+        kv_items[_kv_key(SPO_MANIFEST_KEY, kv_format)] = _kv_encode(manifest, kv_format)
+        
+        self._kv_mset(kv_storage, kv_items)
+        for key in stale_keys:
+            kv_storage.delete(key)
+        if stale_keys:
+            self.logger.info(f"已清理 {len(stale_keys)} 个过期的 SPO 分片")
         
         self.logger.info(
             f"SPO 索引构建完成: "
@@ -1644,9 +1941,79 @@ class AgenticXGraphRAGDemo:
             f"{len(spo_index['object_index'])} 个宾语"
         )
     
+    def _stale_spo_keys(self, kv_storage, manifest: Dict[str, List[str]], kv_format: str) -> List[str]:
+        """对比上次构建的清单，返回本次构建中已不存在的 SPO 分片键"""
+        raw = kv_storage.get(_kv_key(SPO_MANIFEST_KEY, kv_format))
+        if not raw:
+            return []
+        try:
+            previous = _kv_decode(raw, kv_format)
+        except Exception as e:
+            self.logger.warning(f"⚠️ 读取上次的SPO清单失败，跳过过期分片清理: {e}")
+            return []
+        
+        stale_keys = []
+        for index_name, prefix in SPO_SHARD_PREFIXES.items():
+            current = set(manifest[index_name])
+            stale_keys.extend(
+                _kv_key(f"{prefix}{name}", kv_format)
+                for name in previous.get(index_name, [])
+                if name not in current
+            )
+        return stale_keys
+    
+    async def _get_spo_entries(self, index_name: str, name: str) -> List[Dict[str, Any]]:
+        """读取单个 SPO 分片，index_name 为 subject_index / predicate_index / object_index
+        
+        分片中按位置存储的元组条目按 SPO_ENTRY_FIELDS 还原为字典。
+        """
+        kv_storage = await self.storage_manager.get_key_value_storage('default')
+        if not kv_storage:
+            return []
+        
+        kv_format = self._kv_format()
+        raw = kv_storage.get(_kv_key(f"{SPO_SHARD_PREFIXES[index_name]}{name}", kv_format))
+        if not raw:
+            return []
+        fields = SPO_ENTRY_FIELDS[index_name]
+        return [dict(zip(fields, entry)) for entry in _kv_decode(raw, kv_format)]
+    
+    def _kv_mset(self, kv_storage, items: Dict[str, Any]) -> None:
+        """批量写入键值对：存储支持 mset 时合并为一次调用，否则逐个 set
+        
+        只使用存储封装的公开接口，保留其键名空间与序列化处理。
+        """
+        if not items:
+            return
+        
+        mset = getattr(kv_storage, 'mset', None)
+        if callable(mset):
+            mset(items)
+        else:
+            for key, value in items.items():
+                kv_storage.set(key, value)
+    
+    def _get_valid_relationships(self) -> List[Any]:
+        """返回两端实体都存在的关系列表（首次调用时计算并缓存）"""
+        if self._valid_relationships is None:
+            entities = self.knowledge_graph.entities
+            self._valid_relationships = [
+                relationship for relationship in self.knowledge_graph.relationships.values()
+                if relationship.source_entity_id in entities and relationship.target_entity_id in entities
+            ]
+        return self._valid_relationships
+    
+    def _kv_format(self) -> str:
+        """键值数据编码格式：json（默认）或 msgpack"""
+        kv_format = self.config['storage'].get('key_value', {}).get('serialization', 'json')
+        if kv_format == 'msgpack' and msgpack is None:
+            self.logger.warning("⚠️ 未安装msgpack，键值数据回退到JSON编码")
+            self.config['storage'].setdefault('key_value', {})['serialization'] = 'json'
+            return 'json'
+        return kv_format
+    
     async def _cache_key_data(self) -> None:
         """缓存关键数据"""
-        import json
         from datetime import datetime, timezone
         self.logger.info("缓存关键数据...")
         
@@ -1659,22 +2026,19 @@ class AgenticXGraphRAGDemo:
         stats = {
             'entity_count': len(self.knowledge_graph.entities),
             'relationship_count': len(self.knowledge_graph.relationships),
-            'entity_types': {},
-            'relationship_types': {},
+            # 统计实体类型
+            'entity_types': dict(Counter(
+                entity.entity_type.value for entity in self.knowledge_graph.entities.values()
+            )),
+            # 统计关系类型
+            'relationship_types': dict(Counter(
+                relationship.relation_type.value for relationship in self.knowledge_graph.relationships.values()
+            )),
             'build_time': datetime.now(timezone.utc).isoformat()
         }
         
-        # 统计实体类型
-        for entity in self.knowledge_graph.entities.values():
-            entity_type = entity.entity_type.value
-            stats['entity_types'][entity_type] = stats['entity_types'].get(entity_type, 0) + 1
-        
-        # 统计关系类型
-        for relationship in self.knowledge_graph.relationships.values():
-            rel_type = relationship.relation_type.value
-            stats['relationship_types'][rel_type] = stats['relationship_types'].get(rel_type, 0) + 1
-        
-        kv_storage.set('graph_stats', json.dumps(stats, ensure_ascii=False))
+        kv_format = self._kv_format()
+        self._kv_mset(kv_storage, {_kv_key('graph_stats', kv_format): _kv_encode(stats, kv_format)})
         self.logger.info("关键数据缓存完成")
     
     async def interactive_qa(self) -> None:
@@ -1718,9 +2082,9 @@ class AgenticXGraphRAGDemo:
             try:
                 # 获取用户输入
                 if console and Prompt:
-                    query = Prompt.ask("\n[bold cyan]🔍 请输入您的问题[/bold cyan]").strip()
+                    query = (await asyncio.to_thread(Prompt.ask, "\n[bold cyan]🔍 请输入您的问题[/bold cyan]")).strip()
                 else:
-                    query = input("🔍 请输入您的问题: ").strip()
+                    query = (await asyncio.to_thread(input, "🔍 请输入您的问题: ")).strip()
                 
                 if query.lower() in ['quit', 'exit', '退出']:
                     print_success("感谢使用 AgenticX GraphRAG 系统！")
@@ -1732,7 +2096,7 @@ class AgenticXGraphRAGDemo:
                 # 处理查询
                 await self._process_query(query)
                 
-            except KeyboardInterrupt:
+            except (KeyboardInterrupt, EOFError, asyncio.CancelledError):
                 print_success("\n感谢使用 AgenticX GraphRAG 系统！")
                 break
             except Exception as e:
@@ -1836,39 +2200,50 @@ class AgenticXGraphRAGDemo:
             all_hybrid_results = []
             all_graph_results = []
             
-            for search_query in processed_queries[:3]:  # 限制最多3个查询避免过度检索
-                # 1. 执行混合检索
+            search_queries = processed_queries[:3]  # 限制最多3个查询避免过度检索
+            has_graph_retriever = hasattr(self, 'graph_retriever') and self.graph_retriever
+            
+            # 1-2. 所有查询的混合检索和图检索并发执行（两者访问不同后端，互不依赖）
+            hybrid_tasks = []
+            graph_tasks = []
+            for search_query in search_queries:
                 self.logger.info(f"🔍 开始混合检索: '{search_query}', top_k={hybrid_top_k}, min_score={similarity_threshold}")
-                try:
-                    hybrid_results = await self.retriever.retrieve(search_query, top_k=hybrid_top_k, min_score=similarity_threshold)
-                    all_hybrid_results.extend(hybrid_results)
-                    self.logger.info(f"🔍 混合检索 '{search_query}' 返回: {len(hybrid_results)}条")
-                except Exception as e:
-                    self.logger.warning(f"混合检索失败: {e}")
-                
-                # 2. 执行图检索
-                if hasattr(self, 'graph_retriever') and self.graph_retriever:
-                    try:
-                        self.logger.info(f"🔗 开始图检索: '{search_query}', top_k={graph_top_k}, min_score={graph_similarity_threshold}")
-                        graph_results = await self.graph_retriever.retrieve(search_query, top_k=graph_top_k, min_score=graph_similarity_threshold)
-                        all_graph_results.extend(graph_results)
-                        self.logger.info(f"🔗 图检索 '{search_query}' 返回: {len(graph_results)}条")
-                    except Exception as e:
-                        self.logger.warning(f"图检索失败: {e}")
+                hybrid_tasks.append(self.retriever.retrieve(search_query, top_k=hybrid_top_k, min_score=similarity_threshold))
+                if has_graph_retriever:
+                    self.logger.info(f"🔗 开始图检索: '{search_query}', top_k={graph_top_k}, min_score={graph_similarity_threshold}")
+                    graph_tasks.append(self.graph_retriever.retrieve(search_query, top_k=graph_top_k, min_score=graph_similarity_threshold))
+            
+            retrieval_results = await asyncio.gather(*hybrid_tasks, *graph_tasks, return_exceptions=True)
+            hybrid_batches = retrieval_results[:len(hybrid_tasks)]
+            graph_batches = retrieval_results[len(hybrid_tasks):]
+            
+            for search_query, hybrid_results in zip(search_queries, hybrid_batches):
+                if isinstance(hybrid_results, Exception):
+                    self.logger.warning(f"混合检索失败: {hybrid_results}")
+                    continue
+                all_hybrid_results.extend(hybrid_results)
+                self.logger.info(f"🔍 混合检索 '{search_query}' 返回: {len(hybrid_results)}条")
+            
+            for search_query, graph_results in zip(search_queries, graph_batches):
+                if isinstance(graph_results, Exception):
+                    self.logger.warning(f"图检索失败: {graph_results}")
+                    continue
+                all_graph_results.extend(graph_results)
+                self.logger.info(f"🔗 图检索 '{search_query}' 返回: {len(graph_results)}条")
             
             # 3. 合并和去重
             all_results = all_hybrid_results + all_graph_results
             seen_ids = set()
             unique_results = []
             for result in all_results:
-                result_id = getattr(result, 'id', str(hash(result.content)))
+                # 优先使用结果ID；无ID时直接以内容字符串为键（str的哈希值会被缓存，避免每次重新计算并转字符串）
+                result_id = getattr(result, 'id', None) or result.content
                 if result_id not in seen_ids:
                     seen_ids.add(result_id)
                     unique_results.append(result)
             
             # 4. 按相似度排序和筛选
-            unique_results.sort(key=lambda x: getattr(x, 'score', 0), reverse=True)
-            results = unique_results[:hybrid_top_k]
+            results = heapq.nlargest(hybrid_top_k, unique_results, key=lambda x: getattr(x, 'score', 0))
             
             # 5. 统计不同类型的结果
             type_counts = {}
@@ -2014,15 +2389,17 @@ class AgenticXGraphRAGDemo:
             # 提取可能的实体名称
             entity_name = query.replace("是啥", "").replace("是什么", "").replace("?", "").replace("？", "").strip()
             
-            # 在Neo4j中搜索实体
-            cypher_query = """
-            MATCH (n:Entity) 
-            WHERE n.name CONTAINS $entity_name OR n.name =~ ('(?i).*' + $entity_name + '.*')
-            RETURN n.name as name, n.description as description, labels(n) as type
-            LIMIT 5
-            """
+            if not entity_name:
+                print("⚠️ 实体名称为空")
+                return
             
-            results = graph_storage.execute_query(cypher_query, {"entity_name": entity_name})
+            # 在Neo4j中搜索实体：优先走全文索引，索引不可用时回退到CONTAINS匹配
+            try:
+                fulltext_query = _LUCENE_SPECIAL_RE.sub(r'\\\1', entity_name)
+                results = graph_storage.execute_query(ENTITY_FULLTEXT_SEARCH_QUERY, {"entity_name": fulltext_query})
+            except Exception as e:
+                self.logger.debug(f"全文索引查询失败，回退到CONTAINS匹配: {e}")
+                results = graph_storage.execute_query(ENTITY_CONTAINS_SEARCH_QUERY, {"entity_name": entity_name})
             
             if results:
                 print(f"\n🔍 在知识图谱中找到相关实体:")
@@ -2031,6 +2408,13 @@ class AgenticXGraphRAGDemo:
                     print(f"   类型: {result['type']}")
                     if result['description']:
                         print(f"   描述: {result['description']}")
+                    # 从 SPO 分片读取该实体作为主语、宾语的关系
+                    outgoing = await self._get_spo_entries('subject_index', result['name'])
+                    incoming = await self._get_spo_entries('object_index', result['name'])
+                    for relation in outgoing[:MAX_SPO_RELATIONS_DISPLAYED]:
+                        print(f"   关系: {result['name']} -[{relation['predicate']}]-> {relation['object']}")
+                    for relation in incoming[:MAX_SPO_RELATIONS_DISPLAYED]:
+                        print(f"   关系: {relation['subject']} -[{relation['predicate']}]-> {result['name']}")
                     print()
             else:
                 print(f"❌ 在知识图谱中未找到 '{entity_name}' 相关的实体")
@@ -2039,6 +2423,13 @@ class AgenticXGraphRAGDemo:
             self.logger.error(f"直接实体搜索失败: {e}")
             print(f"❌ 实体搜索出错: {e}")
     
+    @staticmethod
+    def _result_snippet(content: str, max_length: int) -> str:
+        """截取检索结果内容片段，max_length<=0 时不截断"""
+        if max_length and max_length > 0 and len(content) > max_length:
+            content = content[:max_length]
+        return content.strip()
+    
     async def _generate_answer(self, query: str, results: List[Any]) -> None:
         """基于检索结果生成答案"""
         try:
@@ -2058,6 +2449,7 @@ class AgenticXGraphRAGDemo:
             retrieval_config = rag_config.get('retrieval', {})
             context_top_k = retrieval_config.get('default_top_k', 10)
             max_context_length = retrieval_config.get('max_context_length', 4000)
+            max_snippet_length = retrieval_config.get('max_snippet_length', MAX_SNIPPET_LENGTH)
             
             # 🔧 修复：完全移除内容截断限制，保留完整信息
             # max_content_per_item = None  # 不再限制单个内容片段长度
@@ -2153,9 +2545,9 @@ class AgenticXGraphRAGDemo:
                      # 🔧 增强：更强的属性访问容错
                      content = ""
                      if hasattr(result, 'content'):
-                         content = str(result.content).strip()
+                         content = self._result_snippet(str(result.content), max_snippet_length)
                      elif isinstance(result, dict):
-                         content = str(result.get('content', '')).strip()
+                         content = self._result_snippet(str(result.get('content', '')), max_snippet_length)
                      
                      if not content:
                          self.logger.warning(f"结果{i+1}内容为空，跳过")
@@ -2261,7 +2653,7 @@ class AgenticXGraphRAGDemo:
                 context_sections.append("=== 检索结果 ===")
                 for i, result in enumerate(context_results):
                     try:
-                        content = str(getattr(result, 'content', result))  # 保留完整内容
+                        content = self._result_snippet(str(getattr(result, 'content', result)), max_snippet_length)
                         score = getattr(result, 'score', 0.0)
                         context_sections.append(f"• 结果{i+1}: {content} [相关度: {score:.3f}]")
                     except:
@@ -2278,13 +2670,14 @@ class AgenticXGraphRAGDemo:
                 self.logger.warning(f"上下文过短: '{context}'")
                 # 如果上下文太短，强制添加一些内容，但不截断
                 if context_results:
-                    context = "=== 检索到的信息 ===\n"
+                    fallback_lines = ["=== 检索到的信息 ==="]
                     for i, result in enumerate(context_results[:3]):
                         try:
-                            content = str(getattr(result, 'content', result))  # 保留完整内容
-                            context += f"结果{i+1}: {content}\n"
+                            content = self._result_snippet(str(getattr(result, 'content', result)), max_snippet_length)
+                            fallback_lines.append(f"结果{i+1}: {content}")
                         except:
-                            context += f"结果{i+1}: {str(result)}\n"
+                            fallback_lines.append(f"结果{i+1}: {str(result)}")
+                    context = "\n".join(fallback_lines) + "\n"
             
             # 使用提示词管理器加载模板
             try:
@@ -2530,6 +2923,26 @@ class AgenticXGraphRAGDemo:
                     logger.info("✅ Neo4j 连接已关闭")
         except Exception as e:
             logger.error(f"❌ 清理资源失败: {e}")
+        
+        await self._close_embedding_sessions()
+    
+    async def _close_embedding_sessions(self) -> None:
+        """关闭嵌入提供商持有的长连接HTTP会话
+        
+        提供商在整个运行期间复用同一个会话（索引和问答阶段共享连接池，避免每次请求重新握手），
+        需在事件循环结束前显式关闭，否则退出时会出现未关闭会话的告警。
+        """
+        for provider in getattr(self.embedding_router, 'providers', None) or []:
+            close = getattr(provider, 'close', None)
+            if close is None:
+                continue
+            try:
+                if asyncio.iscoroutinefunction(close):
+                    await close()
+                else:
+                    close()
+            except Exception as e:
+                logger.warning(f"⚠️ 关闭嵌入服务会话失败: {e}")
 
 
 async def interactive_mode():
@@ -2545,137 +2958,145 @@ async def interactive_mode():
     run_mode = None
     demo_instance = None
     
-    while True:
-        try:
-            # 获取用户输入
-            if console and Prompt:
-                user_input = Prompt.ask("\n[bold green]请输入命令或问题[/bold green] ([dim]/help 查看帮助[/dim])").strip()
-            else:
-                user_input = input("\n请输入命令或问题 (/help 查看帮助): ").strip()
+    try:
+        while True:
+            try:
+                # 获取用户输入
+                if console and Prompt:
+                    user_input = (await asyncio.to_thread(Prompt.ask, "\n[bold green]请输入命令或问题[/bold green] ([dim]/help 查看帮助[/dim])")).strip()
+                else:
+                    user_input = (await asyncio.to_thread(input, "\n请输入命令或问题 (/help 查看帮助): ")).strip()
             
-            if not user_input:
-                continue
+                if not user_input:
+                    continue
             
-            # 处理命令
-            if user_input.startswith('/'):
-                command = user_input.lower()
+                # 处理命令
+                if user_input.startswith('/'):
+                    command = user_input.lower()
                 
-                if command == '/help':
-                    print_help()
+                    if command == '/help':
+                        print_help()
                 
-                elif command == '/clear':
-                    if console:
-                        console.clear()
-                    else:
-                        os.system('clear' if os.name == 'posix' else 'cls')
-                    print_welcome()
+                    elif command == '/clear':
+                        if console:
+                            console.clear()
+                        else:
+                            os.system('clear' if os.name == 'posix' else 'cls')
+                        print_welcome()
                 
-                elif command == '/mode':
-                    run_mode = select_run_mode()
-                    print_success(f"已选择运行模式: {run_mode}")
+                    elif command == '/mode':
+                        run_mode = await select_run_mode()
+                        print_success(f"已选择运行模式: {run_mode}")
                     
-                    # 🔧 修复：选择模式后立即进行完整的初始化流程
-                    try:
-                        # 1. 选择数据目录
-                        print_mode_selection("请选择数据目录")
-                        data_path = display_data_selection()
-                        print_success(f"已选择数据目录: {data_path}")
+                        # 🔧 修复：选择模式后立即进行完整的初始化流程
+                        try:
+                            # 1. 选择数据目录
+                            print_mode_selection("请选择数据目录")
+                            data_path = await display_data_selection()
+                            print_success(f"已选择数据目录: {data_path}")
                         
-                        # 2. 初始化系统
-                        print_action("正在初始化 GraphRAG 系统...")
-                        demo_instance = AgenticXGraphRAGDemo(config_path="configs.yml", mode=run_mode)
-                        demo_instance.data_dir = Path(data_path)  # 设置数据目录
+                            # 2. 初始化系统
+                            print_action("正在初始化 GraphRAG 系统...")
+                            demo_instance = AgenticXGraphRAGDemo(config_path="configs.yml", mode=run_mode)
+                            demo_instance.data_dir = Path(data_path)  # 设置数据目录
                         
-                        # 3. 根据模式执行相应的操作
-                        if run_mode in ['full', 'build']:
-                            print_action("正在构建知识库...")
-                            await demo_instance.run_build_only()
-                            print_success("知识库构建完成！")
+                            # 3. 根据模式执行相应的操作
+                            if run_mode in ['full', 'build']:
+                                print_action("正在构建知识库...")
+                                await demo_instance.run_build_only()
+                                print_success("知识库构建完成！")
                             
-                            if run_mode == 'build':
-                                print_info("构建模式完成，可以使用 /mode 切换到问答模式")
-                                continue
-                            else:  # full模式
-                                print_success("系统已准备就绪，可以开始问答！")
+                                if run_mode == 'build':
+                                    print_info("构建模式完成，可以使用 /mode 切换到问答模式")
+                                    continue
+                                else:  # full模式
+                                    print_success("系统已准备就绪，可以开始问答！")
                         
-                        elif run_mode == 'qa':
-                            print_action("正在加载已有知识库...")
-                            await demo_instance.initialize_components()
-                            await demo_instance._validate_existing_data()
-                            print_success("系统已准备就绪，可以开始问答！")
+                            elif run_mode == 'qa':
+                                print_action("正在加载已有知识库...")
+                                await demo_instance.initialize_components()
+                                await demo_instance._validate_existing_data()
+                                print_success("系统已准备就绪，可以开始问答！")
                         
-                    except Exception as e:
-                        print_error(f"初始化失败: {e}")
-                        demo_instance = None
-                        run_mode = None
-                        data_path = None
+                        except Exception as e:
+                            print_error(f"初始化失败: {e}")
+                            demo_instance = None
+                            run_mode = None
+                            data_path = None
                 
-                elif command == '/data':
-                    data_path = display_data_selection()
-                    print_success(f"已选择数据目录: {data_path}")
+                    elif command == '/data':
+                        data_path = await display_data_selection()
+                        print_success(f"已选择数据目录: {data_path}")
                 
-                elif command == '/rebuild':
-                    if console and Confirm:
-                        rebuild = Confirm.ask("确定要重新构建知识库吗？这将删除现有的索引")
-                    else:
-                        rebuild_input = input("确定要重新构建知识库吗？(y/N): ").strip().lower()
-                        rebuild = rebuild_input in ['y', 'yes']
+                    elif command == '/rebuild':
+                        if console and Confirm:
+                            rebuild = await asyncio.to_thread(Confirm.ask, "确定要重新构建知识库吗？这将删除现有的索引")
+                        else:
+                            rebuild_input = (await asyncio.to_thread(input, "确定要重新构建知识库吗？(y/N): ")).strip().lower()
+                            rebuild = rebuild_input in ['y', 'yes']
                     
-                    if rebuild:
-                        try:
-                            # 🔧 修复：立即执行重建操作
-                            print_mode_selection("请选择数据目录")
-                            data_path = display_data_selection()
-                            print_success(f"已选择数据目录: {data_path}")
+                        if rebuild:
+                            try:
+                                # 🔧 修复：立即执行重建操作
+                                print_mode_selection("请选择数据目录")
+                                data_path = await display_data_selection()
+                                print_success(f"已选择数据目录: {data_path}")
                             
-                            print_action("正在重新构建知识库...")
-                            # 创建build模式的demo实例
-                            rebuild_demo = AgenticXGraphRAGDemo(config_path="configs.yml", mode="build")
-                            rebuild_demo.data_dir = Path(data_path)
+                                print_action("正在重新构建知识库...")
+                                # 创建build模式的demo实例
+                                rebuild_demo = AgenticXGraphRAGDemo(config_path="configs.yml", mode="build")
+                                rebuild_demo.data_dir = Path(data_path)
                             
-                            # 执行重建
-                            await rebuild_demo.run_build_only()
-                            print_success("知识库重建完成！")
+                                # 执行重建
+                                await rebuild_demo.run_build_only()
+                                await rebuild_demo._close_embedding_sessions()
+                                print_success("知识库重建完成！")
                             
-                            # 如果当前有运行的实例，重置它
-                            if demo_instance:
-                                print_info("重置当前系统实例，请重新使用 /mode 选择运行模式")
-                                demo_instance = None
-                                run_mode = None
+                                # 如果当前有运行的实例，重置它
+                                if demo_instance:
+                                    print_info("重置当前系统实例，请重新使用 /mode 选择运行模式")
+                                    demo_instance = None
+                                    run_mode = None
                                 
-                        except Exception as e:
-                            print_error(f"重建失败: {e}")
-                    else:
-                        print_info("取消重新构建")
+                            except Exception as e:
+                                print_error(f"重建失败: {e}")
+                        else:
+                            print_info("取消重新构建")
                 
-                elif command == '/exit':
-                    print_success("感谢使用 AgenticX GraphRAG 系统！")
-                    break
+                    elif command == '/exit':
+                        print_success("感谢使用 AgenticX GraphRAG 系统！")
+                        break
                 
-                else:
-                    print_error(f"未知命令: {command}")
-                    print_info("输入 /help 查看可用命令")
+                    else:
+                        print_error(f"未知命令: {command}")
+                        print_info("输入 /help 查看可用命令")
             
-            else:
-                # 🔧 修复：简化问答处理逻辑
-                if not demo_instance:
-                    print_error("系统尚未初始化，请先使用 /mode 选择运行模式")
-                    continue
+                else:
+                    # 🔧 修复：简化问答处理逻辑
+                    if not demo_instance:
+                        print_error("系统尚未初始化，请先使用 /mode 选择运行模式")
+                        continue
                 
-                # 执行问答
-                try:
-                    print_thinking(f"正在处理您的问题: {user_input}")
-                    await demo_instance._process_query(user_input)
-                except Exception as e:
-                    print_error(f"问答处理失败: {e}")
-                    logger.error(f"Query processing error: {e}", exc_info=True)
+                    # 执行问答
+                    try:
+                        print_thinking(f"正在处理您的问题: {user_input}")
+                        await demo_instance._process_query(user_input)
+                    except Exception as e:
+                        print_error(f"问答处理失败: {e}")
+                        logger.error(f"Query processing error: {e}", exc_info=True)
         
-        except KeyboardInterrupt:
-            print_success("\n感谢使用 AgenticX GraphRAG 系统！")
-            break
-        except Exception as e:
-            print_error(f"处理过程中出现错误: {str(e)}")
-            logger.error(f"Interactive mode error: {e}", exc_info=True)
+            except (KeyboardInterrupt, asyncio.CancelledError):
+                # Ctrl+C 在等待输入时表现为任务取消
+                print_success("\n感谢使用 AgenticX GraphRAG 系统！")
+                break
+            except Exception as e:
+                print_error(f"处理过程中出现错误: {str(e)}")
+                logger.error(f"Interactive mode error: {e}", exc_info=True)
+    
+    finally:
+        # 退出前释放连接（数据库连接、嵌入服务HTTP会话）
+        if demo_instance:
+            await demo_instance.cleanup()
 
 async def main():
     """主函数"""
@@ -2749,5 +3170,5 @@ async def main():
 
 
 if __name__ == "__main__":
-    # 运行异步主函数
-    asyncio.run(main())
\ No newline at end of file
+    # 运行异步主函数（优先使用uvloop事件循环）
+    run_async(main())
\ No newline at end of file
@@ -5,10 +5,13 @@
 展示如何使用 multihop_dataset_builder.py 构建不同领域的多跳问答对数据集
 """
 
+import os
 import asyncio
-from pathlib import Path
 from multihop_dataset_builder import MultihopDatasetBuilder, create_domain_config
 
+# 示例运行所需的输出目录
+_OUTPUT_DIRS = ('./output', './logs')
+
 
 async def example_technology_domain():
     """技术领域示例"""
@@ -114,8 +117,8 @@ async def main():
     print("=" * 50)
     
     # 确保输出目录存在
-    Path("./output").mkdir(exist_ok=True)
-    Path("./logs").mkdir(exist_ok=True)
+    for dir_path in _OUTPUT_DIRS:
+        os.makedirs(dir_path, exist_ok=True)
     
     try:
         # 运行不同领域的示例
@@ -16,9 +16,11 @@ Usage:
 """
 
 import asyncio
+import copy
 import json
 import sys
 import yaml
+from functools import lru_cache
 from pathlib import Path
 from typing import List
 from loguru import logger
@@ -52,6 +54,21 @@ from agenticx.knowledge.graphers.config import GrapherConfig
 
 # 日志已在文件开头配置
 
+# 优先使用 libyaml 的C实现解析
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+@lru_cache(maxsize=8)
+def _load_yaml_cached(path: str, mtime_ns: int):
+    """解析YAML文件，按 (路径, 修改时间) 缓存，文件修改后自动重新解析"""
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.load(f, Loader=_YAML_LOADER)
+
+
+def load_yaml_config(config_path: Path):
+    """加载YAML配置，返回缓存结果的副本，调用方可安全修改"""
+    return copy.deepcopy(_load_yaml_cached(str(config_path), config_path.stat().st_mtime_ns))
+
 
 def basic_graph_construction_demo():
     """Basic knowledge graph construction example"""
@@ -99,8 +116,7 @@ def basic_graph_construction_demo():
     
     # Load config from YAML
     config_path = Path(__file__).parent.parent / "agenticx" / "configs" / "knowledge_graphers_config.yml"
-    with open(config_path, "r", encoding="utf-8") as f:
-        config_data = yaml.safe_load(f)
+    config_data = load_yaml_config(config_path)
 
     grapher_config = GrapherConfig.from_dict(config_data)
 
@@ -140,8 +156,7 @@ def graph_quality_validation_demo(graph: KnowledgeGraph):
     
     # Load config from YAML
     config_path = Path(__file__).parent.parent / "configs" / "knowledge_graphers_config.yml"
-    with open(config_path, "r", encoding="utf-8") as f:
-        config_data = yaml.safe_load(f)
+    config_data = load_yaml_config(config_path)
 
     grapher_config = GrapherConfig.from_dict(config_data)
 
@@ -178,8 +193,7 @@ def graphrag_construction_demo():
     
     # Load config from YAML
     config_path = Path(__file__).parent.parent / "configs" / "knowledge_graphers_config.yml"
-    with open(config_path, "r", encoding="utf-8") as f:
-        config_data = yaml.safe_load(f)
+    config_data = load_yaml_config(config_path)
 
     grapher_config = GrapherConfig.from_dict(config_data)
 
@@ -293,8 +307,7 @@ def incremental_update_demo(graph: KnowledgeGraph):
     
     # Load config from YAML
     config_path = Path(__file__).parent.parent / "configs" / "knowledge_graphers_config.yml"
-    with open(config_path, "r", encoding="utf-8") as f:
-        config_data = yaml.safe_load(f)
+    config_data = load_yaml_config(config_path)
 
     grapher_config = GrapherConfig.from_dict(config_data)
 
@@ -16,15 +16,41 @@ AgenticX GraphRAG 演示系统主程序
 import absl.logging
 absl.logging.set_verbosity('info')
 
+import re
 import sys
+import json
 import yaml
+import heapq
+import hashlib
 import asyncio
 import warnings
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterator
+from collections import Counter
 from datetime import datetime, timezone
 from loguru import logger
 
+try:
+    import orjson
+except ImportError:
+    # 未安装orjson时回退到标准json
+    orjson = None
+
+# 优先使用 libyaml 的C实现解析配置
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+try:
+    import msgpack
+except ImportError:
+    # 未安装msgpack时键值数据使用JSON编码
+    msgpack = None
+
+try:
+    import numpy as np
+except ImportError:
+    # 未安装numpy时无法进行向量精度压缩，保持float32列表
+    np = None
+
 # 过滤警告信息
 warnings.filterwarnings("ignore", category=DeprecationWarning, module="importlib._bootstrap")
 warnings.filterwarnings("ignore", message=".*datetime.datetime.utcnow.*")
@@ -91,6 +117,103 @@ from agenticx.llms import LlmFactory
 
 # 导入本地模块
 from prompt_manager import PromptManager
+from async_runner import run_async
+
+# 向量批量写入的默认分块大小
+VECTOR_INSERT_BATCH_SIZE = 512
+# 单条检索结果写入提示词上下文的最大字符数，0 表示不截断（默认保留完整内容）
+MAX_SNIPPET_LENGTH = 0
+
+# SPO 分片条目格式版本，写入键名前缀；条目格式变化时递增，读取方不会拿到旧格式的数据
+# v2: 条目为定长元组（字段顺序见 SPO_ENTRY_FIELDS），v1 为字典
+SPO_INDEX_VERSION = 2
+# SPO 索引分片键前缀：每个主语/谓语/宾语单独存为一个键
+SPO_SHARD_PREFIXES = {
+    'subject_index': f'spo:v{SPO_INDEX_VERSION}:s:',
+    'predicate_index': f'spo:v{SPO_INDEX_VERSION}:p:',
+    'object_index': f'spo:v{SPO_INDEX_VERSION}:o:'
+}
+# SPO 清单键，记录上次构建的分片名称，用于清理已不存在的分片
+SPO_MANIFEST_KEY = f'spo:v{SPO_INDEX_VERSION}:manifest'
+# 直接实体搜索时每个实体最多展示的关系数
+MAX_SPO_RELATIONS_DISPLAYED = 10
+# SPO 索引条目为定长元组，各索引的字段顺序
+SPO_ENTRY_FIELDS = {
+    'subject_index': ('predicate', 'object', 'relationship_id'),
+    'predicate_index': ('subject', 'object', 'relationship_id'),
+    'object_index': ('subject', 'predicate', 'relationship_id')
+}
+# 键值数据的msgpack编码版本，写入键名前缀，与JSON编码的旧数据互不覆盖
+KV_MSGPACK_VERSION = 2
+
+# 实体名称全文索引（替代逐行正则匹配的全量扫描）
+ENTITY_FULLTEXT_INDEX = 'entityNameIndex'
+CREATE_ENTITY_FULLTEXT_INDEX_QUERY = (
+    f"CREATE FULLTEXT INDEX {ENTITY_FULLTEXT_INDEX} IF NOT EXISTS "
+    "FOR (n:Entity) ON EACH [n.name, n.description]"
+)
+ENTITY_FULLTEXT_SEARCH_QUERY = f"""
+CALL db.index.fulltext.queryNodes('{ENTITY_FULLTEXT_INDEX}', $entity_name) YIELD node, score
+RETURN node.name as name, node.description as description, labels(node) as type
+LIMIT 5
+"""
+# 全文索引不可用时的回退查询（不含正则分支）
+ENTITY_CONTAINS_SEARCH_QUERY = """
+MATCH (n:Entity)
+WHERE toLower(n.name) CONTAINS toLower($entity_name)
+RETURN n.name as name, n.description as description, labels(n) as type
+LIMIT 5
+"""
+_LUCENE_SPECIAL_RE = re.compile(r'([+\-!(){}\[\]^"~*?:\\/&|])')
+
+
+def _json_dumps(obj: Any) -> str:
+    """序列化为JSON字符串（优先使用orjson）"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def _kv_key(key: str, kv_format: str) -> str:
+    """按编码格式生成键名，msgpack数据带版本前缀"""
+    if kv_format == 'msgpack':
+        return f"v{KV_MSGPACK_VERSION}:{key}"
+    return key
+
+
+def _kv_encode(obj: Any, kv_format: str):
+    """按编码格式序列化键值数据"""
+    if kv_format == 'msgpack':
+        return msgpack.packb(obj, use_bin_type=True)
+    return _json_dumps(obj)
+
+
+def _kv_decode(raw, kv_format: str) -> Any:
+    """按编码格式反序列化键值数据"""
+    if kv_format == 'msgpack':
+        return msgpack.unpackb(raw, raw=False)
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+# 支持的文档文件类型（小写扩展名，含点号）
+SUPPORTED_EXTENSIONS = frozenset({'.pdf', '.txt', '.json', '.csv', '.md', '.doc', '.docx', '.ppt', '.pptx'})
+
+
+def _iter_files(root: Path, extensions) -> Iterator[Path]:
+    """单次遍历目录树（os.scandir + 显式栈），返回扩展名在 extensions 中的文件
+    
+    不进入符号链接目录，遍历顺序与 Path.rglob('*') 一致。
+    """
+    stack = [os.fspath(root)]
+    while stack:
+        subdirs = []
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in extensions:
+                    yield Path(entry.path)
+        stack.extend(reversed(subdirs))
 
 
 class AgenticXGraphRAGDemo:
@@ -110,6 +233,18 @@ class AgenticXGraphRAGDemo:
         self.knowledge_graph = None
         self.retriever = None
         
+        # 向量写入进度回调：callback(label, inserted_count)
+        self.vector_progress_callback = None
+        
+        # 嵌入缓存（按文本内容哈希索引，延迟加载）
+        self._embedding_cache = None
+        self._embedding_cache_dirty = False
+        # 本次构建用到的缓存键，保存时剔除其余条目
+        self._embedding_cache_used = set()
+        
+        # 两端实体都存在的有效关系（store_and_index 中计算一次，供各索引构建共享）
+        self._valid_relationships = None
+        
         # 提示词管理器
         self.prompt_manager = PromptManager("prompts")
         
@@ -130,7 +265,7 @@ class AgenticXGraphRAGDemo:
             raise FileNotFoundError(f"配置文件未找到: {self.config_path}")
             
         with open(config_file, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
+            config = yaml.load(f, Loader=_YAML_LOADER)
             
         # 环境变量替换
         self._replace_env_vars(config)
@@ -202,8 +337,22 @@ class AgenticXGraphRAGDemo:
         # 4. 初始化检索器
         await self._initialize_retriever()
         
+        # 5. 确保实体名称全文索引存在
+        self._ensure_entity_fulltext_index()
+        
         self.logger.info("系统组件初始化完成")
     
+    def _ensure_entity_fulltext_index(self) -> None:
+        """创建实体名称全文索引（已存在时跳过）"""
+        try:
+            from agenticx.storage import StorageType
+            graph_storage = self.storage_manager.get_storage(StorageType.NEO4J)
+            if graph_storage:
+                graph_storage.execute_query(CREATE_ENTITY_FULLTEXT_INDEX_QUERY)
+                self.logger.debug(f"实体全文索引已就绪: {ENTITY_FULLTEXT_INDEX}")
+        except Exception as e:
+            self.logger.warning(f"⚠️ 实体全文索引创建失败，实体搜索将回退到CONTAINS匹配: {e}")
+    
     async def _initialize_llm(self) -> None:
         """初始化 LLM 客户端"""
         from agenticx.knowledge.graphers.config import LLMConfig
@@ -530,17 +679,11 @@ class AgenticXGraphRAGDemo:
         if not self.data_dir.exists():
             raise FileNotFoundError(f"数据目录不存在: {self.data_dir}")
         
-        # 支持的文件类型
-        supported_extensions = {'.pdf', '.txt', '.json', '.csv', '.md', '.doc', '.docx', '.ppt', '.pptx'}
-        
-        # 扫描文件
-        files = []
-        for file_path in self.data_dir.rglob('*'):
-            if file_path.is_file() and file_path.suffix.lower() in supported_extensions:
-                files.append(file_path)
+        # 单次遍历扫描文件
+        files = list(_iter_files(self.data_dir, SUPPORTED_EXTENSIONS))
         
         if not files:
-            raise ValueError(f"数据目录中没有找到支持的文件类型: {supported_extensions}")
+            raise ValueError(f"数据目录中没有找到支持的文件类型: {sorted(SUPPORTED_EXTENSIONS)}")
         
         self.logger.info(f"找到 {len(files)} 个文件: {[f.name for f in files]}")
         return files
@@ -764,6 +907,12 @@ class AgenticXGraphRAGDemo:
         relation_count = len(self.knowledge_graph.relationships)
         self.logger.info(f"输入数据: {entity_count}个实体, {relation_count}个关系")
         
+        # 预先筛选有效关系，向量索引和SPO索引共享同一份结果
+        self._valid_relationships = None
+        valid_relationships = self._get_valid_relationships()
+        if len(valid_relationships) < relation_count:
+            self.logger.info(f"过滤悬空关系: {relation_count - len(valid_relationships)}个")
+        
         # 1. 存储到图数据库
         try:
             graph_storage = await self.storage_manager.get_graph_storage('default')
@@ -779,29 +928,26 @@ class AgenticXGraphRAGDemo:
             self.logger.error(f"❌ 图数据库存储失败: {e}")
             self.logger.warning("继续执行其他索引步骤")
         
-        # 2. 构建向量索引
-        try:
-            await self._build_vector_index()
-        except Exception as e:
-            self.logger.error(f"❌ 向量索引构建失败: {e}")
-        
-        # 3. 构建BM25索引
+        # 2. 构建BM25索引
         try:
             await self._build_bm25_index()
         except Exception as e:
             self.logger.error(f"❌ BM25索引构建失败: {e}")
         
-        # 4. 构建 SPO 索引
-        try:
-            await self._build_spo_index()
-        except Exception as e:
-            self.logger.error(f"❌ SPO索引构建失败: {e}")
-        
-        # 5. 缓存关键数据
-        try:
-            await self._cache_key_data()
-        except Exception as e:
-            self.logger.error(f"❌ 数据缓存失败: {e}")
+        # 3. 并发构建向量索引、SPO索引并缓存关键数据
+        # 三者写入互不相关的存储（向量库 / KV-SPO / KV-统计），等待嵌入API时可同时完成SPO构建和统计缓存
+        phases = [
+            ("向量索引构建", self._build_vector_index()),
+            ("SPO索引构建", self._build_spo_index()),
+            ("数据缓存", self._cache_key_data()),
+        ]
+        results = await asyncio.gather(*(coro for _, coro in phases), return_exceptions=True)
+        for (phase_name, _), result in zip(phases, results):
+            if isinstance(result, Exception):
+                self.logger.error(f"❌ {phase_name}失败: {result}")
+        
+        # 4. 持久化嵌入缓存，供下次增量索引复用
+        self._save_embedding_cache()
         
         # 统计向量索引总数 - 统计所有独立向量存储实例
         total_vectors = 0
@@ -888,7 +1034,10 @@ class AgenticXGraphRAGDemo:
         )
         vector_chunker = get_chunker(vector_chunking_config['strategy'], vector_config)
         
+        # 分块流式写入，避免一次性持有全部向量记录
+        insert_batch_size = self.config['storage']['vector'].get('insert_batch_size', VECTOR_INSERT_BATCH_SIZE)
         document_records = []
+        inserted_count = 0
         for doc_idx, document in enumerate(self.documents):
             # 使用向量检索专用分块
             try:
@@ -916,12 +1065,12 @@ class AgenticXGraphRAGDemo:
             
             for chunk_idx, chunk in enumerate(chunks):
                 # 生成嵌入
-                embedding = await self.embedding_router.aembed_text(chunk.content)
+                embedding = await self._embed_text(chunk.content)
                 
                 # 创建向量记录
                 record = VectorRecord(
                     id=f"doc_{doc_idx}_chunk_{chunk_idx}",
-                    vector=embedding,
+                    vector=self._quantize_vector(embedding),
                     payload={
                         'content': chunk.content,  # 🔧 修复：将content放到payload中
                         'metadata': {
@@ -935,11 +1084,18 @@ class AgenticXGraphRAGDemo:
                     }
                 )
                 document_records.append(record)
+                if len(document_records) >= insert_batch_size:
+                    inserted_count = await self._flush_vector_records(
+                        self._document_vector_storage, document_records, "文档向量", inserted_count
+                    )
         
-        # 批量存储文档分块向量
-        if document_records:
-            await self._document_vector_storage.add(document_records)
-            self.logger.info(f"✅ 文档向量索引完成: {len(document_records)}条记录")
+        # 写入剩余的文档分块向量
+        inserted_count = await self._flush_vector_records(
+            self._document_vector_storage, document_records, "文档向量", inserted_count
+        )
+        await self._finish_bulk_load(self._document_vector_storage)
+        if inserted_count:
+            self.logger.info(f"✅ 文档向量索引完成: {inserted_count}条记录")
             self.logger.info(f"📄 存储到集合: {storage_config['collection_name']}")
         else:
             self.logger.warning("❌ 没有文档分块可以索引")
@@ -1105,15 +1261,19 @@ class AgenticXGraphRAGDemo:
             if not vector_storage:
                 return
         
+        insert_batch_size = self.config['storage']['vector'].get('insert_batch_size', VECTOR_INSERT_BATCH_SIZE)
+        buffer = []
+        inserted_count = 0
+        
         # 为实体构建向量索引
-        entity_records = []
+        entity_count = 0
         for entity in self.knowledge_graph.entities.values():
             entity_text = f"{entity.name}: {entity.description or ''}"
-            embedding = await self.embedding_router.aembed_text(entity_text)
+            embedding = await self._embed_text(entity_text)
             
             record = VectorRecord(
                 id=f"legacy_entity_{entity.id}",
-                vector=embedding,
+                vector=self._quantize_vector(embedding),
                 metadata={
                     'type': 'legacy_entity',
                     'entity_type': entity.entity_type.value,
@@ -1122,41 +1282,176 @@ class AgenticXGraphRAGDemo:
                 },
                 content=entity_text
             )
-            entity_records.append(record)
+            buffer.append(record)
+            entity_count += 1
+            if len(buffer) >= insert_batch_size:
+                inserted_count = await self._flush_vector_records(vector_storage, buffer, "传统向量", inserted_count)
         
         # 为关系构建向量索引
-        relationship_records = []
-        for relationship in self.knowledge_graph.relationships.values():
-            source_entity = self.knowledge_graph.get_entity(relationship.source_entity_id)
-            target_entity = self.knowledge_graph.get_entity(relationship.target_entity_id)
-            
-            if source_entity and target_entity:
-                rel_text = f"{source_entity.name} {relationship.relation_type.value} {target_entity.name}"
-                embedding = await self.embedding_router.aembed_text(rel_text)
-                
-                record = VectorRecord(
-                    id=f"legacy_relation_{relationship.id}",
-                    vector=embedding,
-                    metadata={
-                        'type': 'legacy_relationship',
-                        'relation_type': relationship.relation_type.value,
-                        'source_entity': source_entity.name,
-                        'target_entity': target_entity.name,
-                        'confidence': relationship.confidence
-                    },
-                    content=rel_text
-                )
-                relationship_records.append(record)
+        relationship_count = 0
+        entities = self.knowledge_graph.entities
+        for relationship in self._get_valid_relationships():
+            source_entity = entities[relationship.source_entity_id]
+            target_entity = entities[relationship.target_entity_id]
+            
+            relation_type = relationship.relation_type.value
+            rel_text = f"{source_entity.name} {relation_type} {target_entity.name}"
+            embedding = await self._embed_text(rel_text)
+            
+            record = VectorRecord(
+                id=f"legacy_relation_{relationship.id}",
+                vector=self._quantize_vector(embedding),
+                metadata={
+                    'type': 'legacy_relationship',
+                    'relation_type': relation_type,
+                    'source_entity': source_entity.name,
+                    'target_entity': target_entity.name,
+                    'confidence': relationship.confidence
+                },
+                content=rel_text
+            )
+            buffer.append(record)
+            relationship_count += 1
+            if len(buffer) >= insert_batch_size:
+                inserted_count = await self._flush_vector_records(vector_storage, buffer, "传统向量", inserted_count)
+        
+        # 写入剩余记录
+        inserted_count = await self._flush_vector_records(vector_storage, buffer, "传统向量", inserted_count)
+        await self._finish_bulk_load(vector_storage)
+        if inserted_count:
+            self.logger.debug(f"传统向量索引: {entity_count}个实体 + {relationship_count}个关系")
+    
+    def _embedding_cache_config(self) -> Dict[str, Any]:
+        """获取嵌入缓存配置"""
+        return self.config.get('embeddings', {}).get('cache', {})
+    
+    def _embedding_cache_path(self) -> Path:
+        """嵌入缓存文件路径（numpy .npz 格式）"""
+        return Path(self._embedding_cache_config().get('path', './workspace/cache/embedding_cache.npz'))
+    
+    def _load_embedding_cache(self) -> Dict[int, List[float]]:
+        """加载持久化的嵌入缓存（numpy数组文件，禁止反序列化任意对象）"""
+        if not self._embedding_cache_config().get('enabled', True):
+            return {}
+        if np is None:
+            self.logger.warning("⚠️ 未安装numpy，嵌入缓存不持久化到磁盘")
+            return {}
+        cache_path = self._embedding_cache_path()
+        if not cache_path.exists():
+            return {}
+        try:
+            with np.load(cache_path, allow_pickle=False) as data:
+                cache = dict(zip(data['keys'].tolist(), data['vectors'].tolist()))
+            self.logger.info(f"加载嵌入缓存: {len(cache)}条")
+            return cache
+        except Exception as e:
+            self.logger.warning(f"嵌入缓存加载失败，将重新生成: {e}")
+            return {}
+    
+    def _save_embedding_cache(self) -> None:
+        """持久化嵌入缓存
         
-        # 批量存储
-        all_records = entity_records + relationship_records
-        if all_records:
-            vector_storage.add(all_records)
-            self.logger.debug(f"传统向量索引: {len(entity_records)}个实体 + {len(relationship_records)}个关系")
+        只保留本次构建用到的条目，避免缓存随多次构建无限增长；先写临时文件再原子替换，中断时不会损坏已有缓存。
+        """
+        if not self._embedding_cache:
+            return
+        # 剔除本次构建未使用的条目
+        if len(self._embedding_cache_used) < len(self._embedding_cache):
+            self._embedding_cache = {key: self._embedding_cache[key] for key in self._embedding_cache_used}
+            self._embedding_cache_dirty = True
+        if not self._embedding_cache_dirty or not self._embedding_cache:
+            return
+        if not self._embedding_cache_config().get('enabled', True) or np is None:
+            return
+        cache_path = self._embedding_cache_path()
+        tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+        try:
+            keys = np.fromiter(self._embedding_cache.keys(), dtype=np.uint64, count=len(self._embedding_cache))
+            vectors = np.asarray(list(self._embedding_cache.values()), dtype=np.float32)
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, keys=keys, vectors=vectors)
+            os.replace(tmp_path, cache_path)
+            self._embedding_cache_dirty = False
+            self.logger.info(f"嵌入缓存已保存: {len(self._embedding_cache)}条")
+        except Exception as e:
+            self.logger.warning(f"嵌入缓存保存失败: {e}")
+            tmp_path.unlink(missing_ok=True)
+    
+    def _embedding_cache_key(self, text: str) -> int:
+        """嵌入缓存键：嵌入模型 + 文本内容的64位哈希，模型变化时缓存自动失效"""
+        embed_config = self.config.get('embeddings', {})
+        provider = embed_config.get('router', {}).get('primary_provider', '')
+        provider_config = embed_config.get(provider, {})
+        namespace = f"{provider}:{provider_config.get('model', '')}:{provider_config.get('dimensions', '')}"
+        digest = hashlib.blake2b(f"{namespace}|{text}".encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big')
+    
+    async def _embed_text(self, text: str) -> List[float]:
+        """生成文本嵌入，命中缓存时跳过嵌入API调用
+        
+        内存去重始终生效（重复的实体/关系文本只嵌入一次），cache.enabled 仅控制磁盘持久化。
+        """
+        if self._embedding_cache is None:
+            self._embedding_cache = self._load_embedding_cache()
+        
+        key = self._embedding_cache_key(text)
+        self._embedding_cache_used.add(key)
+        embedding = self._embedding_cache.get(key)
+        if embedding is None:
+            embedding = await self.embedding_router.aembed_text(text)
+            self._embedding_cache[key] = embedding
+            self._embedding_cache_dirty = True
+        return embedding
+    
+    def _quantize_vector(self, embedding: List[float]):
+        """按配置压缩向量精度（float16可将向量内存和传输量减半）"""
+        vector_dtype = self.config['storage']['vector'].get('vector_dtype', 'float32')
+        if vector_dtype != 'float16':
+            return embedding
+        if np is None:
+            self.logger.warning("⚠️ 未安装numpy，vector_dtype=float16 不生效，保持float32")
+            self.config['storage']['vector']['vector_dtype'] = 'float32'
+            return embedding
+        return np.asarray(embedding, dtype=np.float16)
+    
+    async def _flush_vector_records(self, vector_storage, buffer: List[VectorRecord], label: str, inserted_count: int) -> int:
+        """将缓冲区中的向量记录写入存储并清空缓冲区，返回累计写入数量"""
+        if not buffer:
+            return inserted_count
+        
+        batch = list(buffer)
+        buffer.clear()
+        
+        # 异步存储直接等待，同步存储放到线程池中执行，避免阻塞事件循环
+        if asyncio.iscoroutinefunction(vector_storage.add):
+            await vector_storage.add(batch)
+        else:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, vector_storage.add, batch)
+        
+        inserted_count += len(batch)
+        self.logger.debug(f"{label}写入进度: {inserted_count}条记录")
+        if self.vector_progress_callback:
+            self.vector_progress_callback(label, inserted_count)
+        return inserted_count
+    
+    async def _finish_bulk_load(self, vector_storage) -> None:
+        """批量导入完成后统一flush一次，由存储端封存段并构建索引"""
+        if not self.config['storage']['vector'].get('defer_indexing', True):
+            return
+        collection = getattr(vector_storage, 'collection', None)
+        if collection is None or not hasattr(collection, 'flush'):
+            return
+        try:
+            # Milvus flush 为阻塞调用，放到线程中执行以免阻塞事件循环
+            await asyncio.to_thread(collection.flush)
+            self.logger.debug(f"{type(vector_storage).__name__}: 批量导入完成，已统一flush")
+        except Exception as e:
+            self.logger.warning(f"批量导入后flush失败: {e}")
     
     async def _build_spo_index(self) -> None:
         """构建 SPO 三元组索引"""
-        import json
         self.logger.info("构建 SPO 三元组索引...")
         
         # 调试：检查存储管理器状态
@@ -1170,51 +1465,53 @@ class AgenticXGraphRAGDemo:
             self.logger.warning("⚠️ 未找到键值存储，跳过SPO索引构建")
             return
         
-        # 构建 SPO 索引
+        # 构建 SPO 索引，条目为定长元组，字段顺序见 SPO_ENTRY_FIELDS
+        subject_index = {}  # 主语索引
+        predicate_index = {}  # 谓语索引
+        object_index = {}  # 宾语索引
         spo_index = {
-            'subject_index': {},  # 主语索引
-            'predicate_index': {},  # 谓语索引
-            'object_index': {}  # 宾语索引
+            'subject_index': subject_index,
+            'predicate_index': predicate_index,
+            'object_index': object_index
         }
         
-        for relationship in self.knowledge_graph.relationships.values():
-            source_entity = self.knowledge_graph.get_entity(relationship.source_entity_id)
-            target_entity = self.knowledge_graph.get_entity(relationship.target_entity_id)
-            
-            if source_entity and target_entity:
-                subject = source_entity.name
-                predicate = relationship.relation_type.value
-                object_name = target_entity.name
-                
-                # 主语索引
-                if subject not in spo_index['subject_index']:
-                    spo_index['subject_index'][subject] = []
-                spo_index['subject_index'][subject].append({
-                    'predicate': predicate,
-                    'object': object_name,
-                    'relationship_id': relationship.id
-                })
-                
-                # 谓语索引
-                if predicate not in spo_index['predicate_index']:
-                    spo_index['predicate_index'][predicate] = []
-                spo_index['predicate_index'][predicate].append({
-                    'subject': subject,
-                    'object': object_name,
-                    'relationship_id': relationship.id
-                })
-                
-                # 宾语索引
-                if object_name not in spo_index['object_index']:
-                    spo_index['object_index'][object_name] = []
-                spo_index['object_index'][object_name].append({
-                    'subject': subject,
-                    'predicate': predicate,
-                    'relationship_id': relationship.id
-                })
-        
-        # 存储索引（序列化为JSON）
-        kv_storage.set('spo_index', json.dumps(spo_index, ensure_ascii=False))
+        # 热循环中预先绑定方法引用
+        subject_setdefault = subject_index.setdefault
+        predicate_setdefault = predicate_index.setdefault
+        object_setdefault = object_index.setdefault
+        
+        entities = self.knowledge_graph.entities
+        for relationship in self._get_valid_relationships():
+            subject = entities[relationship.source_entity_id].name
+            predicate = relationship.relation_type.value
+            object_name = entities[relationship.target_entity_id].name
+            relationship_id = relationship.id
+            
+            subject_setdefault(subject, []).append((predicate, object_name, relationship_id))
+            predicate_setdefault(predicate, []).append((subject, object_name, relationship_id))
+            object_setdefault(object_name, []).append((subject, predicate, relationship_id))
+        
+        # 分片存储索引：查询时只需读取相关的键，无需解析整个索引
+        kv_format = self._kv_format()
+        kv_items = {}
+        for index_name, index in spo_index.items():
+            prefix = SPO_SHARD_PREFIXES[index_name]
+            for name, entries in index.items():
+                kv_items[_kv_key(f"{prefix}{name}", kv_format)] = _kv_encode(entries, kv_format)
+        
+        # 清单键记录本次构建的分片名称，写入前先据上次清单找出已不存在的分片
+        manifest = {index_name: list(index) for index_name, index in spo_index.items()}
+        stale_keys = self._stale_spo_keys(kv_storage, manifest, kv_format)
+        # 旧版本写入的单键整体索引已被分片取代
+        if kv_storage.exists('spo_index'):
+            stale_keys.append('spo_index')
+        kv_items[_kv_key(SPO_MANIFEST_KEY, kv_format)] = _kv_encode(manifest, kv_format)
+        
+        self._kv_mset(kv_storage, kv_items)
+        for key in stale_keys:
+            kv_storage.delete(key)
+        if stale_keys:
+            self.logger.info(f"已清理 {len(stale_keys)} 个过期的 SPO 分片")
         
         self.logger.info(
             f"SPO 索引构建完成: "
@@ -1223,9 +1520,79 @@ class AgenticXGraphRAGDemo:
             f"{len(spo_index['object_index'])} 个宾语"
         )
     
+    def _stale_spo_keys(self, kv_storage, manifest: Dict[str, List[str]], kv_format: str) -> List[str]:
+        """对比上次构建的清单，返回本次构建中已不存在的 SPO 分片键"""
+        raw = kv_storage.get(_kv_key(SPO_MANIFEST_KEY, kv_format))
+        if not raw:
+            return []
+        try:
+            previous = _kv_decode(raw, kv_format)
+        except Exception as e:
+            self.logger.warning(f"⚠️ 读取上次的SPO清单失败，跳过过期分片清理: {e}")
+            return []
+        
+        stale_keys = []
+        for index_name, prefix in SPO_SHARD_PREFIXES.items():
+            current = set(manifest[index_name])
+            stale_keys.extend(
+                _kv_key(f"{prefix}{name}", kv_format)
+                for name in previous.get(index_name, [])
+                if name not in current
+            )
+        return stale_keys
+    
+    async def _get_spo_entries(self, index_name: str, name: str) -> List[Dict[str, Any]]:
+        """读取单个 SPO 分片，index_name 为 subject_index / predicate_index / object_index
+        
+        分片中按位置存储的元组条目按 SPO_ENTRY_FIELDS 还原为字典。
+        """
+        kv_storage = await self.storage_manager.get_key_value_storage('default')
+        if not kv_storage:
+            return []
+        
+        kv_format = self._kv_format()
+        raw = kv_storage.get(_kv_key(f"{SPO_SHARD_PREFIXES[index_name]}{name}", kv_format))
+        if not raw:
+            return []
+        fields = SPO_ENTRY_FIELDS[index_name]
+        return [dict(zip(fields, entry)) for entry in _kv_decode(raw, kv_format)]
+    
+    def _kv_mset(self, kv_storage, items: Dict[str, Any]) -> None:
+        """批量写入键值对：存储支持 mset 时合并为一次调用，否则逐个 set
+        
+        只使用存储封装的公开接口，保留其键名空间与序列化处理。
+        """
+        if not items:
+            return
+        
+        mset = getattr(kv_storage, 'mset', None)
+        if callable(mset):
+            mset(items)
+        else:
+            for key, value in items.items():
+                kv_storage.set(key, value)
+    
+    def _get_valid_relationships(self) -> List[Any]:
+        """返回两端实体都存在的关系列表（首次调用时计算并缓存）"""
+        if self._valid_relationships is None:
+            entities = self.knowledge_graph.entities
+            self._valid_relationships = [
+                relationship for relationship in self.knowledge_graph.relationships.values()
+                if relationship.source_entity_id in entities and relationship.target_entity_id in entities
+            ]
+        return self._valid_relationships
+    
+    def _kv_format(self) -> str:
+        """键值数据编码格式：json（默认）或 msgpack"""
+        kv_format = self.config['storage'].get('key_value', {}).get('serialization', 'json')
+        if kv_format == 'msgpack' and msgpack is None:
+            self.logger.warning("⚠️ 未安装msgpack，键值数据回退到JSON编码")
+            self.config['storage'].setdefault('key_value', {})['serialization'] = 'json'
+            return 'json'
+        return kv_format
+    
     async def _cache_key_data(self) -> None:
         """缓存关键数据"""
-        import json
         from datetime import datetime, timezone
         self.logger.info("缓存关键数据...")
         
@@ -1238,22 +1605,19 @@ class AgenticXGraphRAGDemo:
         stats = {
             'entity_count': len(self.knowledge_graph.entities),
             'relationship_count': len(self.knowledge_graph.relationships),
-            'entity_types': {},
-            'relationship_types': {},
+            # 统计实体类型
+            'entity_types': dict(Counter(
+                entity.entity_type.value for entity in self.knowledge_graph.entities.values()
+            )),
+            # 统计关系类型
+            'relationship_types': dict(Counter(
+                relationship.relation_type.value for relationship in self.knowledge_graph.relationships.values()
+            )),
             'build_time': datetime.now(timezone.utc).isoformat()
         }
         
-        # 统计实体类型
-        for entity in self.knowledge_graph.entities.values():
-            entity_type = entity.entity_type.value
-            stats['entity_types'][entity_type] = stats['entity_types'].get(entity_type, 0) + 1
-        
-        # 统计关系类型
-        for relationship in self.knowledge_graph.relationships.values():
-            rel_type = relationship.relation_type.value
-            stats['relationship_types'][rel_type] = stats['relationship_types'].get(rel_type, 0) + 1
-        
-        kv_storage.set('graph_stats', json.dumps(stats, ensure_ascii=False))
+        kv_format = self._kv_format()
+        self._kv_mset(kv_storage, {_kv_key('graph_stats', kv_format): _kv_encode(stats, kv_format)})
         self.logger.info("关键数据缓存完成")
     
     async def interactive_qa(self) -> None:
@@ -1275,7 +1639,7 @@ class AgenticXGraphRAGDemo:
         while True:
             try:
                 # 获取用户输入
-                query = input("🔍 请输入您的问题: ").strip()
+                query = (await asyncio.to_thread(input, "🔍 请输入您的问题: ")).strip()
                 
                 if query.lower() in ['quit', 'exit', '退出']:
                     print("👋 感谢使用 AgenticX GraphRAG 系统！")
@@ -1287,7 +1651,7 @@ class AgenticXGraphRAGDemo:
                 # 处理查询
                 await self._process_query(query)
                 
-            except KeyboardInterrupt:
+            except (KeyboardInterrupt, EOFError, asyncio.CancelledError):
                 print("\n👋 感谢使用 AgenticX GraphRAG 系统！")
                 break
             except Exception as e:
@@ -1324,36 +1688,44 @@ class AgenticXGraphRAGDemo:
             self.logger.info(f"🎯 最终检索参数: hybrid_top_k={hybrid_top_k}, graph_top_k={graph_top_k}, vector_threshold={similarity_threshold}, graph_threshold={graph_similarity_threshold}")
             
 
-            # 1. 执行混合检索 - 🔧 修复：传递相似度阈值
+            # 1-2. 并发执行混合检索和图检索（两者访问不同后端，互不依赖）
             self.logger.info(f"🔍 开始混合检索，请求top_k={hybrid_top_k}, min_score={similarity_threshold}")
-            hybrid_results = await self.retriever.retrieve(query, top_k=hybrid_top_k, min_score=similarity_threshold)
+            retrieval_tasks = [self.retriever.retrieve(query, top_k=hybrid_top_k, min_score=similarity_threshold)]
+            has_graph_retriever = hasattr(self, 'graph_retriever') and self.graph_retriever
+            if has_graph_retriever:
+                self.logger.info(f"🔗 开始图检索，请求top_k={graph_top_k}, min_score={graph_similarity_threshold}")
+                retrieval_tasks.append(self.graph_retriever.retrieve(query, top_k=graph_top_k, min_score=graph_similarity_threshold))
+            else:
+                self.logger.warning("🔗 图检索器不可用")
+            
+            retrieval_results = await asyncio.gather(*retrieval_tasks, return_exceptions=True)
+            
+            hybrid_results = retrieval_results[0]
+            if isinstance(hybrid_results, Exception):
+                raise hybrid_results
             self.logger.info(f"🔍 混合检索实际返回: {len(hybrid_results)}条")
             
-            # 2. 执行图检索 - 🔧 修复：使用配置的top_k和更低的相似度阈值
             graph_results = []
-            if hasattr(self, 'graph_retriever') and self.graph_retriever:
-                try:
-                    self.logger.info(f"🔗 开始图检索，请求top_k={graph_top_k}, min_score={graph_similarity_threshold}")
-                    graph_results = await self.graph_retriever.retrieve(query, top_k=graph_top_k, min_score=graph_similarity_threshold)
+            if has_graph_retriever:
+                if isinstance(retrieval_results[1], Exception):
+                    self.logger.warning(f"图检索失败: {retrieval_results[1]}")
+                else:
+                    graph_results = retrieval_results[1]
                     self.logger.info(f"🔗 图检索实际返回: {len(graph_results)}条")
-                except Exception as e:
-                    self.logger.warning(f"图检索失败: {e}")
-            else:
-                self.logger.warning("🔗 图检索器不可用")
             
             # 3. 合并和去重
             all_results = hybrid_results + graph_results
             seen_ids = set()
             unique_results = []
             for result in all_results:
-                result_id = getattr(result, 'id', str(hash(result.content)))
+                # 优先使用结果ID；无ID时直接以内容字符串为键（str的哈希值会被缓存，避免每次重新计算并转字符串）
+                result_id = getattr(result, 'id', None) or result.content
                 if result_id not in seen_ids:
                     seen_ids.add(result_id)
                     unique_results.append(result)
             
             # 4. 按相似度排序和筛选
-            unique_results.sort(key=lambda x: getattr(x, 'score', 0), reverse=True)
-            results = unique_results[:hybrid_top_k]
+            results = heapq.nlargest(hybrid_top_k, unique_results, key=lambda x: getattr(x, 'score', 0))
             
             # 5. 统计不同类型的结果
             type_counts = {}
@@ -1402,15 +1774,17 @@ class AgenticXGraphRAGDemo:
             # 提取可能的实体名称
             entity_name = query.replace("是啥", "").replace("是什么", "").replace("?", "").replace("？", "").strip()
             
-            # 在Neo4j中搜索实体
-            cypher_query = """
-            MATCH (n:Entity) 
-            WHERE n.name CONTAINS $entity_name OR n.name =~ ('(?i).*' + $entity_name + '.*')
-            RETURN n.name as name, n.description as description, labels(n) as type
-            LIMIT 5
-            """
+            if not entity_name:
+                print("⚠️ 实体名称为空")
+                return
             
-            results = graph_storage.execute_query(cypher_query, {"entity_name": entity_name})
+            # 在Neo4j中搜索实体：优先走全文索引，索引不可用时回退到CONTAINS匹配
+            try:
+                fulltext_query = _LUCENE_SPECIAL_RE.sub(r'\\\1', entity_name)
+                results = graph_storage.execute_query(ENTITY_FULLTEXT_SEARCH_QUERY, {"entity_name": fulltext_query})
+            except Exception as e:
+                self.logger.debug(f"全文索引查询失败，回退到CONTAINS匹配: {e}")
+                results = graph_storage.execute_query(ENTITY_CONTAINS_SEARCH_QUERY, {"entity_name": entity_name})
             
             if results:
                 print(f"\n🔍 在知识图谱中找到相关实体:")
@@ -1419,6 +1793,13 @@ class AgenticXGraphRAGDemo:
                     print(f"   类型: {result['type']}")
                     if result['description']:
                         print(f"   描述: {result['description']}")
+                    # 从 SPO 分片读取该实体作为主语、宾语的关系
+                    outgoing = await self._get_spo_entries('subject_index', result['name'])
+                    incoming = await self._get_spo_entries('object_index', result['name'])
+                    for relation in outgoing[:MAX_SPO_RELATIONS_DISPLAYED]:
+                        print(f"   关系: {result['name']} -[{relation['predicate']}]-> {relation['object']}")
+                    for relation in incoming[:MAX_SPO_RELATIONS_DISPLAYED]:
+                        print(f"   关系: {relation['subject']} -[{relation['predicate']}]-> {result['name']}")
                     print()
             else:
                 print(f"❌ 在知识图谱中未找到 '{entity_name}' 相关的实体")
@@ -1427,6 +1808,13 @@ class AgenticXGraphRAGDemo:
             self.logger.error(f"直接实体搜索失败: {e}")
             print(f"❌ 实体搜索出错: {e}")
     
+    @staticmethod
+    def _result_snippet(content: str, max_length: int) -> str:
+        """截取检索结果内容片段，max_length<=0 时不截断"""
+        if max_length and max_length > 0 and len(content) > max_length:
+            content = content[:max_length]
+        return content.strip()
+    
     async def _generate_answer(self, query: str, results: List[Any]) -> None:
         """基于检索结果生成答案"""
         try:
@@ -1436,6 +1824,7 @@ class AgenticXGraphRAGDemo:
             rag_config = self.config.get('rag', {})
             retrieval_config = rag_config.get('retrieval', {})
             context_top_k = retrieval_config.get('default_top_k', 10)
+            max_snippet_length = retrieval_config.get('max_snippet_length', MAX_SNIPPET_LENGTH)
             
             # 分类检索结果
             graph_results = [r for r in results if r.metadata and r.metadata.get('search_source') == 'graph_vector']
@@ -1479,7 +1868,7 @@ class AgenticXGraphRAGDemo:
                         
                     vector_type = result.metadata.get('vector_type', 'unknown') if result.metadata else 'unknown'
                     score = getattr(result, 'score', 0.0)
-                    content = result.content.strip()
+                    content = self._result_snippet(result.content, max_snippet_length)
                     
                     # 根据类型分类，保持原始内容完整性
                     if vector_type == 'node' or 'Entity:' in content:
@@ -1541,8 +1930,8 @@ class AgenticXGraphRAGDemo:
                             if page_match:
                                 doc_info = f"Page {page_match.group(1)}"
                         
-                        # 保持文档内容完整性，只做基本格式清理
-                        content = result.content.strip()
+                        # 只做基本格式清理，配置了 max_snippet_length 时按上限截断
+                        content = self._result_snippet(result.content, max_snippet_length)
                         # 规范化页码分隔符格式
                         content = content.replace('--- Page', '\n--- Page')
                         
@@ -1796,6 +2185,26 @@ class AgenticXGraphRAGDemo:
                     logger.info("✅ Neo4j 连接已关闭")
         except Exception as e:
             logger.error(f"❌ 清理资源失败: {e}")
+        
+        await self._close_embedding_sessions()
+    
+    async def _close_embedding_sessions(self) -> None:
+        """关闭嵌入提供商持有的长连接HTTP会话
+        
+        提供商在整个运行期间复用同一个会话（索引和问答阶段共享连接池，避免每次请求重新握手），
+        需在事件循环结束前显式关闭，否则退出时会出现未关闭会话的告警。
+        """
+        for provider in getattr(self.embedding_router, 'providers', None) or []:
+            close = getattr(provider, 'close', None)
+            if close is None:
+                continue
+            try:
+                if asyncio.iscoroutinefunction(close):
+                    await close()
+                else:
+                    close()
+            except Exception as e:
+                logger.warning(f"⚠️ 关闭嵌入服务会话失败: {e}")
 
 
 async def main():
@@ -1860,5 +2269,5 @@ async def main():
 
 
 if __name__ == "__main__":
-    # 运行异步主函数
-    asyncio.run(main())
\ No newline at end of file
+    # 运行异步主函数（优先使用uvloop事件循环）
+    run_async(main())
\ No newline at end of file
@@ -13,16 +13,63 @@ python multihop_dataset_builder.py --data_path ./documents --output ./output.jso
 """
 
 import os
+import re
 import sys
 import json
 import yaml
+import math
+import time
+import random
+import hashlib
 import asyncio
 import argparse
+import textwrap
+import itertools
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, AsyncIterator, AsyncIterable, Iterable, Union
 from loguru import logger
 from dotenv import load_dotenv
 
+try:
+    import orjson
+except ImportError:
+    # 未安装orjson时回退到标准json
+    orjson = None
+
+# 优先使用 libyaml 的C实现解析配置
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+try:
+    import tiktoken
+except ImportError:
+    # 未安装tiktoken时按 字符数/4 粗略估算Token数
+    tiktoken = None
+
+# LLM调用中可重试的瞬时错误：超时、连接错误、429限流与5xx服务端错误
+_TRANSIENT_LLM_ERRORS = [TimeoutError, asyncio.TimeoutError, ConnectionError]
+try:
+    import openai
+    _TRANSIENT_LLM_ERRORS += [
+        openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError
+    ]
+except ImportError:
+    # 未安装openai时仅按内置异常与HTTP状态码判断
+    openai = None
+try:
+    import litellm
+    _TRANSIENT_LLM_ERRORS += [
+        getattr(litellm, name) for name in
+        ('Timeout', 'APIConnectionError', 'RateLimitError', 'ServiceUnavailableError', 'InternalServerError')
+        if hasattr(litellm, name)
+    ]
+except ImportError:
+    # 未安装litellm时仅按内置异常与HTTP状态码判断，且不注入共享HTTP客户端
+    litellm = None
+_TRANSIENT_LLM_ERRORS = tuple(_TRANSIENT_LLM_ERRORS)
+
+# 部分提供商（如百炼）将HTTP错误包装为通用异常，仅在消息中保留状态码
+_TRANSIENT_HTTP_STATUS_RE = re.compile(r'\bHTTP (?:429|5\d\d)\b')
+
 # 加载环境变量
 script_dir = Path(__file__).parent
 env_path = script_dir / ".env"
@@ -36,6 +83,98 @@ from agenticx.knowledge.graphers.config import LLMConfig
 
 # 导入本地组件
 from prompt_manager import PromptManager
+from async_runner import run_async
+
+
+# 文档内容占模型最大Token数的比例上限，超出时拆分为多个提示词分片
+PROMPT_TOKEN_BUDGET_RATIO = 0.7
+
+
+# 配置中的环境变量占位符 ${VAR}，支持一个字符串中出现多个
+_ENV_RE = re.compile(r'\$\{([^}]+)\}')
+
+
+def _expand_env(value: str) -> str:
+    """替换字符串中的 ${VAR}，未设置的变量保留原样"""
+    return _ENV_RE.sub(lambda m: os.environ.get(m.group(1), m.group(0)), value)
+
+
+def _is_transient_llm_error(error: BaseException) -> bool:
+    """判断LLM调用异常是否值得重试（沿异常链检查被包装的原始异常）"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, _TRANSIENT_LLM_ERRORS):
+            return True
+        status_code = getattr(error, 'status_code', None)
+        if isinstance(status_code, int) and (status_code == 429 or status_code >= 500):
+            return True
+        if _TRANSIENT_HTTP_STATUS_RE.search(str(error)):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def _json_loads(text: Union[str, bytes]) -> Any:
+    """解析JSON（优先使用orjson）"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _json_dumps(obj: Any, indent: bool = False) -> str:
+    """序列化为JSON字符串（优先使用orjson），indent=True 时使用2空格缩进"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None)
+
+
+class RateLimiter:
+    """请求数/Token数双令牌桶限流器
+    
+    在发起请求前主动等待额度，避免并发请求触发429后再退避重试。
+    """
+    
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.max_request_capacity = requests_per_minute
+        self.max_token_capacity = tokens_per_minute
+        self.available_request_capacity = requests_per_minute
+        self.available_token_capacity = tokens_per_minute
+        self._last_update = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    def _refill(self) -> None:
+        """按流逝时间补充额度"""
+        now = time.monotonic()
+        elapsed = now - self._last_update
+        self._last_update = now
+        self.available_request_capacity = min(
+            self.max_request_capacity,
+            self.available_request_capacity + self.max_request_capacity * elapsed / 60.0
+        )
+        self.available_token_capacity = min(
+            self.max_token_capacity,
+            self.available_token_capacity + self.max_token_capacity * elapsed / 60.0
+        )
+    
+    async def acquire(self, estimated_tokens: int = 0) -> None:
+        """等待直到有足够的请求和Token额度，然后扣除"""
+        # 单个请求超过桶容量时按桶容量计，否则永远无法获得额度
+        estimated_tokens = min(estimated_tokens, self.max_token_capacity)
+        
+        while True:
+            # 锁内只做额度检查与扣除，等待放在锁外，避免一个等待者阻塞其它请求
+            async with self._lock:
+                self._refill()
+                if self.available_request_capacity >= 1 and self.available_token_capacity >= estimated_tokens:
+                    self.available_request_capacity -= 1
+                    self.available_token_capacity -= estimated_tokens
+                    return
+                
+                # 计算补足额度所需的等待时间
+                request_wait = (1 - self.available_request_capacity) * 60.0 / self.max_request_capacity
+                token_wait = (estimated_tokens - self.available_token_capacity) * 60.0 / self.max_token_capacity
+            await asyncio.sleep(max(request_wait, token_wait, 0.01))
 
 
 class MultihopDatasetBuilder:
@@ -46,6 +185,20 @@ class MultihopDatasetBuilder:
         self.config = self._load_config()
         self.prompt_manager = PromptManager("prompts")
         self.llm_client = None
+        # LLM客户端类型（provider_type_mapping 映射结果），仅litellm支持一次请求返回多个候选
+        self.llm_type = None
+        self.rate_limiter = None
+        # 当前LLM的模型与温度，作为响应缓存键的一部分
+        self.llm_signature = ""
+        # 共享的HTTP连接池客户端（仅litellm类提供商创建）
+        self.http_client = None
+        # LLM调用失败时的重试次数及指数退避参数（秒）
+        self.retry_attempts = 3
+        self.retry_backoff_base = 1.0
+        self.retry_backoff_cap = 30.0
+        # Token编码器与单次提示词的Token预算（None表示不限制）
+        self.token_encoder = None
+        self.prompt_token_budget = None
         
         # 设置日志
         logger.add(
@@ -59,7 +212,7 @@ class MultihopDatasetBuilder:
         """加载配置文件"""
         try:
             with open(self.config_path, 'r', encoding='utf-8') as f:
-                config = yaml.safe_load(f)
+                config = yaml.load(f, Loader=_YAML_LOADER)
             
             # 替换环境变量
             self._replace_env_vars(config)
@@ -70,17 +223,23 @@ class MultihopDatasetBuilder:
             return {}
     
     def _replace_env_vars(self, obj: Any) -> None:
-        """递归替换配置中的环境变量"""
-        if isinstance(obj, dict):
-            for key, value in obj.items():
-                if isinstance(value, str) and value.startswith("${") and value.endswith("}"):
-                    env_var = value[2:-1]
-                    obj[key] = os.getenv(env_var, value)
+        """替换配置中的环境变量（显式栈迭代遍历，原地修改）"""
+        stack = [obj]
+        while stack:
+            current = stack.pop()
+            if isinstance(current, dict):
+                items = current.items()
+            elif isinstance(current, list):
+                items = enumerate(current)
+            else:
+                continue
+            
+            for key, value in items:
+                if isinstance(value, str):
+                    if '${' in value:
+                        current[key] = _expand_env(value)
                 elif isinstance(value, (dict, list)):
-                    self._replace_env_vars(value)
-        elif isinstance(obj, list):
-            for item in obj:
-                self._replace_env_vars(item)
+                    stack.append(value)
     
     async def initialize_llm(self, provider: str = None, model: str = None) -> None:
         """初始化LLM客户端"""
@@ -125,7 +284,70 @@ class MultihopDatasetBuilder:
         )
         
         self.llm_client = LlmFactory.create_llm(llm_config)
+        self.llm_type = llm_type
+        self.llm_signature = f"{llm_config.provider}/{llm_config.model}|{llm_config.temperature}"
         logger.info(f"✅ LLM初始化完成: {llm_config.provider}/{llm_config.model}")
+        
+        self.retry_attempts = max(1, int(llm_config_dict.get('retry_attempts') or 1))
+        
+        # Token估算：模型不在tiktoken映射中时（如qwen）使用通用的cl100k_base编码近似
+        if tiktoken is not None:
+            try:
+                self.token_encoder = tiktoken.encoding_for_model(llm_config.model)
+            except KeyError:
+                self.token_encoder = tiktoken.get_encoding("cl100k_base")
+        max_tokens = llm_config_dict.get('max_tokens')
+        if max_tokens:
+            self.prompt_token_budget = int(max_tokens * PROMPT_TOKEN_BUDGET_RATIO)
+        self.retry_backoff_base = float(llm_config_dict.get('retry_backoff_base', self.retry_backoff_base))
+        self.retry_backoff_cap = float(llm_config_dict.get('retry_backoff_cap', self.retry_backoff_cap))
+        
+        # 按并发规模预设HTTP连接池：默认容量取数据集生成的并发LLM调用上限，可由 http_limits 覆盖
+        http_limits = llm_config_dict.get('http_limits', self.config['llm'].get('http_limits')) or {}
+        max_concurrency = self.prompt_manager.load_prompt("multihop_dataset_generation").get('config', {}).get('max_concurrency', 4)
+        self._configure_http_pool(llm_type, http_limits, max(1, int(max_concurrency)), llm_config_dict.get('timeout'))
+        
+        # 按配置的RPM/TPM配额创建限流器
+        rpm = llm_config_dict.get('rpm', self.config['llm'].get('rpm'))
+        tpm = llm_config_dict.get('tpm', self.config['llm'].get('tpm'))
+        if rpm and tpm:
+            self.rate_limiter = RateLimiter(float(rpm), float(tpm))
+            logger.info(f"🚦 LLM限流: {rpm} RPM / {tpm} TPM")
+    
+    def _configure_http_pool(self, llm_type: str, http_limits: Dict[str, Any], max_concurrency: int,
+                             timeout: Optional[float]) -> None:
+        """创建与并发规模匹配的共享异步HTTP客户端，并注入到支持外部会话的LLM客户端"""
+        if llm_type != 'litellm' or litellm is None:
+            logger.debug(f"LLM类型 {llm_type} 不支持注入HTTP客户端，使用其默认连接池")
+            return
+        
+        try:
+            import httpx
+        except ImportError as e:
+            logger.warning(f"⚠️ 无法配置HTTP连接池: {e}")
+            return
+        
+        max_connections = int(http_limits.get('max_connections', max_concurrency))
+        max_keepalive = int(http_limits.get('max_keepalive_connections', max_connections))
+        client_kwargs = {
+            'limits': httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive
+            )
+        }
+        # 未配置超时时保留httpx的默认超时，避免卡住的请求长期占用并发名额
+        if timeout:
+            client_kwargs['timeout'] = httpx.Timeout(timeout)
+        
+        self.http_client = httpx.AsyncClient(**client_kwargs)
+        litellm.aclient_session = self.http_client
+        logger.info(f"🔌 HTTP连接池: max_connections={max_connections}, max_keepalive_connections={max_keepalive}")
+    
+    async def close(self) -> None:
+        """释放共享的HTTP客户端"""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
     
     async def load_documents(self, data_path: str, file_types: List[str] = None) -> List[Document]:
         """加载文档
@@ -137,7 +359,6 @@ class MultihopDatasetBuilder:
         Returns:
             文档列表
         """
-        documents = []
         data_path = Path(data_path)
         
         if file_types is None:
@@ -147,10 +368,9 @@ class MultihopDatasetBuilder:
         if data_path.is_file():
             file_paths = [data_path]
         elif data_path.is_dir():
-            file_paths = []
-            for file_type in file_types:
-                file_paths.extend(data_path.glob(f"*.{file_type}"))
-                file_paths.extend(data_path.glob(f"**/*.{file_type}"))
+            # 单次遍历目录树，按后缀集合过滤，避免每种类型重复遍历及顶层文件被重复收集
+            wanted = {f".{file_type.lower()}" for file_type in file_types}
+            file_paths = [p for p in data_path.rglob("*") if p.suffix.lower() in wanted and p.is_file()]
         else:
             logger.error(f"❌ 数据路径不存在: {data_path}")
             return []
@@ -160,48 +380,53 @@ class MultihopDatasetBuilder:
         # 加载文档
         reader_config = self.config['knowledge']['readers']
         
-        for file_path in file_paths:
-            try:
-                # 根据文件类型选择读取器
-                if file_path.suffix.lower() == '.pdf' and reader_config['pdf']['enabled']:
-                    pdf_config = reader_config['pdf'].copy()
-                    pdf_config.pop('enabled', None)
-                    reader = PDFReader(**pdf_config)
-                elif file_path.suffix.lower() in ['.txt', '.md'] and reader_config['text']['enabled']:
-                    text_config = reader_config['text'].copy()
-                    text_config.pop('enabled', None)
-                    reader = TextReader(**text_config)
-                elif file_path.suffix.lower() == '.json' and reader_config['json']['enabled']:
-                    json_config = reader_config['json'].copy()
-                    json_config.pop('enabled', None)
-                    reader = JSONReader(**json_config)
-                elif file_path.suffix.lower() == '.csv' and reader_config['csv']['enabled']:
-                    csv_config = reader_config['csv'].copy()
-                    csv_config.pop('enabled', None)
-                    reader = CSVReader(**csv_config)
-                else:
-                    logger.warning(f"⚠️ 不支持的文件类型: {file_path}")
-                    continue
-                
-                # 读取文档
-                result = await reader.read(str(file_path))
-                
-                # 处理返回结果
-                if isinstance(result, list):
-                    for doc in result:
-                        documents.append(doc)
-                        logger.info(f"✅ 加载文档: {file_path.name} ({len(doc.content)} 字符)")
-                else:
-                    documents.append(result)
-                    logger.info(f"✅ 加载文档: {file_path.name} ({len(result.content)} 字符)")
-                
-            except Exception as e:
-                logger.error(f"❌ 加载文档失败 {file_path}: {e}")
-                continue
+        # 并发读取所有文件
+        results = await asyncio.gather(
+            *(self._read_one(file_path, reader_config) for file_path in file_paths),
+            return_exceptions=True
+        )
+        documents = [doc for result in results if not isinstance(result, Exception) for doc in result]
         
         logger.info(f"📚 总计加载 {len(documents)} 个文档")
         return documents
     
+    async def _read_one(self, file_path: Path, reader_config: Dict[str, Any]) -> List[Document]:
+        """读取单个文件，失败时返回空列表"""
+        try:
+            # 根据文件类型选择读取器
+            if file_path.suffix.lower() == '.pdf' and reader_config['pdf']['enabled']:
+                pdf_config = reader_config['pdf'].copy()
+                pdf_config.pop('enabled', None)
+                reader = PDFReader(**pdf_config)
+            elif file_path.suffix.lower() in ['.txt', '.md'] and reader_config['text']['enabled']:
+                text_config = reader_config['text'].copy()
+                text_config.pop('enabled', None)
+                reader = TextReader(**text_config)
+            elif file_path.suffix.lower() == '.json' and reader_config['json']['enabled']:
+                json_config = reader_config['json'].copy()
+                json_config.pop('enabled', None)
+                reader = JSONReader(**json_config)
+            elif file_path.suffix.lower() == '.csv' and reader_config['csv']['enabled']:
+                csv_config = reader_config['csv'].copy()
+                csv_config.pop('enabled', None)
+                reader = CSVReader(**csv_config)
+            else:
+                logger.warning(f"⚠️ 不支持的文件类型: {file_path}")
+                return []
+            
+            # 读取文档
+            result = await reader.read(str(file_path))
+            
+            # 处理返回结果
+            documents = result if isinstance(result, list) else [result]
+            for doc in documents:
+                logger.info(f"✅ 加载文档: {file_path.name} ({len(doc.content)} 字符)")
+            return documents
+            
+        except Exception as e:
+            logger.error(f"❌ 加载文档失败 {file_path}: {e}")
+            return []
+    
     def prepare_prompt_variables(self, domain_config: Dict[str, Any] = None) -> Dict[str, Any]:
         """准备提示词变量
         
@@ -221,6 +446,9 @@ class MultihopDatasetBuilder:
             'max_answer_sentences': prompt_config.get('config', {}).get('max_answer_sentences', 3),
             'target_language': prompt_config.get('config', {}).get('target_language', '中文'),
             'allowed_terms': prompt_config.get('config', {}).get('allowed_terms', '英文术语'),
+            'questions_per_call': prompt_config.get('config', {}).get('questions_per_call', 5),
+            'max_concurrency': prompt_config.get('config', {}).get('max_concurrency', 4),
+            'choices_per_call': prompt_config.get('config', {}).get('choices_per_call', 1),
         }
         
         # 默认变量值
@@ -248,24 +476,184 @@ class MultihopDatasetBuilder:
         Returns:
             多跳问答对列表
         """
+        dataset = [item async for item in self.iter_dataset(documents, domain_config, custom_variables)]
+        logger.info(f"📊 合并去重后共 {len(dataset)} 个问答对")
+        return dataset
+    
+    async def iter_dataset(self, 
+                           documents: List[Document], 
+                           domain_config: Dict[str, Any] = None,
+                           custom_variables: Dict[str, Any] = None) -> AsyncIterator[Dict[str, Any]]:
+        """逐个产出多跳问答对，每个文档组合生成完成即产出（已去重）
+        
+        Args:
+            documents: 文档列表
+            domain_config: 领域特定配置
+            custom_variables: 自定义变量
+        """
         if not self.llm_client:
             logger.error("❌ LLM客户端未初始化")
-            return []
-        
-        # 准备文档内容
-        documents_text = ""
-        for i, doc in enumerate(documents, 1):
-            doc_name = getattr(doc.metadata, 'name', f'document_{i}')
-            documents_text += f"\n\n=== 文档 {i}: {doc_name} ===\n{doc.content}"
+            return
         
         # 准备提示词变量
         variables = self.prepare_prompt_variables(domain_config)
-        variables['documents'] = documents_text
         
         # 应用自定义变量
         if custom_variables:
             variables.update(custom_variables)
         
+        sample_nums = variables['sample_nums']
+        docs_per_call = max(1, variables['min_documents_per_question'])
+        choices_per_call = max(1, variables['choices_per_call'])
+        if choices_per_call > 1 and self.llm_type != 'litellm':
+            logger.warning(f"⚠️ LLM类型 {self.llm_type} 不支持n参数，choices_per_call 回退为1")
+            choices_per_call = 1
+        variables['choices_per_call'] = choices_per_call
+        
+        # 将文档拆分为多个小组合，每个组合单独生成一部分问题，替代一次性的超长提示词
+        # 每次请求返回 choices_per_call 个候选结果，所需组合数相应减少
+        doc_combos = self._sample_document_combos(
+            len(documents), docs_per_call,
+            math.ceil(sample_nums / (max(1, variables['questions_per_call']) * choices_per_call))
+        )
+        doc_combos = self._shard_combos(documents, doc_combos, variables)
+        quotas = [sample_nums // len(doc_combos)] * len(doc_combos)
+        for i in range(sample_nums % len(doc_combos)):
+            quotas[i] += 1
+        
+        logger.info(f"🚀 开始生成多跳数据集，目标数量: {sample_nums}，文档组合: {len(doc_combos)}个")
+        
+        semaphore = asyncio.Semaphore(max(1, variables['max_concurrency']))
+        
+        async def _one(shard, quota):
+            if quota <= 0:
+                return []
+            combo, max_doc_tokens = shard
+            combo_variables = dict(variables)
+            combo_variables['sample_nums'] = math.ceil(quota / choices_per_call)
+            combo_variables['documents'] = self._format_documents(documents, combo, max_doc_tokens)
+            async with semaphore:
+                return await self._generate_for_combo(combo_variables)
+        
+        tasks = [asyncio.create_task(_one(combo, quota)) for combo, quota in zip(doc_combos, quotas)]
+        
+        # 按完成顺序合并并按问题去重
+        seen_queries = set()
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                for item in await next_done:
+                    query = item['query'].strip()
+                    if query in seen_queries:
+                        continue
+                    seen_queries.add(query)
+                    yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    def _sample_document_combos(self, doc_count: int, docs_per_call: int, combo_count: int) -> List[tuple]:
+        """抽取文档下标组合，组合总数不足时全部使用"""
+        if doc_count <= docs_per_call:
+            return [tuple(range(doc_count))]
+        
+        if math.comb(doc_count, docs_per_call) <= combo_count:
+            return list(itertools.combinations(range(doc_count), docs_per_call))
+        
+        # 组合空间较大时随机抽样，避免展开全部组合
+        # 固定随机种子，相同输入得到相同组合，使响应缓存在重复运行时可以命中
+        rng = random.Random(f"{doc_count}:{docs_per_call}:{combo_count}")
+        combos = set()
+        while len(combos) < combo_count:
+            combos.add(tuple(sorted(rng.sample(range(doc_count), docs_per_call))))
+        return sorted(combos)
+    
+    def _estimate_tokens(self, text: str) -> int:
+        """估算文本Token数，未安装tiktoken时按 字符数/4 估算"""
+        if self.token_encoder is not None:
+            return len(self.token_encoder.encode(text, disallowed_special=()))
+        return len(text) // 4
+    
+    def _truncate_to_tokens(self, text: str, max_tokens: int) -> str:
+        """按Token数截断文本，未安装tiktoken时按 字符数/4 估算"""
+        max_tokens = max(0, max_tokens)
+        if self.token_encoder is not None:
+            tokens = self.token_encoder.encode(text, disallowed_special=())
+            if len(tokens) <= max_tokens:
+                return text
+            return self.token_encoder.decode(tokens[:max_tokens])
+        return text[:max_tokens * 4]
+    
+    def _shard_combos(self, documents: List[Document], doc_combos: List[tuple], 
+                      variables: Dict[str, Any]) -> List[tuple]:
+        """按Token预算处理文档组合，返回 (文档组合, 单文档Token上限) 列表
+        
+        分片只在两侧都不少于 min_documents_per_question 个文档时切分，
+        仍超出预算的分片按平均份额截断各文档内容，保证每个问题可跨足够多的文档
+        """
+        if not self.prompt_token_budget:
+            return [(combo, None) for combo in doc_combos]
+        
+        min_docs = max(1, variables['min_documents_per_question'])
+        
+        # 模板及其它变量本身的开销
+        template_prompt = self.prompt_manager.format_prompt(
+            "multihop_dataset_generation", "template", **{**variables, 'documents': ''}
+        )
+        budget = self.prompt_token_budget - self._estimate_tokens(template_prompt or "")
+        
+        # 每个文档的Token数只计算一次（含文档标题行）
+        doc_tokens = {}
+        def _tokens(i):
+            if i not in doc_tokens:
+                doc_tokens[i] = self._estimate_tokens(self._format_documents(documents, (i,)))
+            return doc_tokens[i]
+        
+        shards = []
+        for combo in doc_combos:
+            current, used = [], 0
+            for pos, i in enumerate(combo):
+                tokens = _tokens(i)
+                remaining = len(combo) - pos
+                if used + tokens > budget and len(current) >= min_docs and remaining >= min_docs:
+                    shards.append(tuple(current))
+                    current, used = [], 0
+                current.append(i)
+                used += tokens
+            if current:
+                shards.append(tuple(current))
+        
+        result = []
+        truncated = 0
+        for shard in shards:
+            if sum(_tokens(i) for i in shard) <= budget:
+                result.append((shard, None))
+            else:
+                result.append((shard, max(1, budget // len(shard))))
+                truncated += 1
+        
+        if len(shards) > len(doc_combos):
+            logger.info(f"✂️ 按Token预算 {budget} 将 {len(doc_combos)} 个文档组合拆分为 {len(shards)} 个分片")
+        if truncated:
+            logger.warning(f"⚠️ {truncated} 个文档组合超出Token预算 {budget}，已按平均份额截断文档内容")
+        return result
+    
+    def _format_documents(self, documents: List[Document], combo: tuple, 
+                          max_doc_tokens: Optional[int] = None) -> str:
+        """拼接组合内的文档内容，文档编号沿用全局编号，可按单文档Token上限截断"""
+        parts = []
+        for i in combo:
+            doc = documents[i]
+            doc_name = getattr(doc.metadata, 'name', f'document_{i + 1}')
+            header = f"\n\n=== 文档 {i + 1}: {doc_name} ===\n"
+            content = doc.content
+            if max_doc_tokens:
+                content = self._truncate_to_tokens(content, max_doc_tokens - self._estimate_tokens(header))
+            parts.append(header)
+            parts.append(content)
+        return "".join(parts)
+    
+    async def _generate_for_combo(self, variables: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """针对一个文档组合调用LLM生成问答对"""
         # 格式化提示词
         prompt = self.prompt_manager.format_prompt(
             "multihop_dataset_generation", 
@@ -277,29 +665,26 @@ class MultihopDatasetBuilder:
             logger.error("❌ 提示词格式化失败")
             return []
         
-        logger.info(f"🚀 开始生成多跳数据集，目标数量: {variables['sample_nums']}")
         logger.debug(f"📝 提示词长度: {len(prompt)} 字符")
         
+        # 相同模型、温度和提示词（即相同文档与变量）的结果直接复用
+        cache_path = self._response_cache_path(f"{prompt}|n={variables.get('choices_per_call', 1)}")
+        if cache_path and cache_path.exists():
+            try:
+                with open(cache_path, 'rb') as f:
+                    cached_dataset = _json_loads(f.read())
+                logger.info(f"♻️ 命中响应缓存: {len(cached_dataset)} 个问答对")
+                return cached_dataset
+            except Exception as e:
+                logger.warning(f"⚠️ 响应缓存读取失败，重新生成: {e}")
+        
+        choices_per_call = max(1, variables.get('choices_per_call', 1))
         try:
-            # 调用LLM生成数据集
-            response = await self.llm_client.achat(prompt)
-            
-            # 解析JSON响应
-            response_text = response.strip()
-            
-            # 尝试提取JSON部分
-            if "```json" in response_text:
-                start = response_text.find("```json") + 7
-                end = response_text.find("```", start)
-                if end != -1:
-                    response_text = response_text[start:end].strip()
+            response_texts = await self._call_llm(prompt, choices_per_call)
             
-            # 解析JSON
-            dataset = json.loads(response_text)
-            
-            if not isinstance(dataset, list):
-                logger.error("❌ 响应格式错误：期望JSON数组")
-                return []
+            dataset = []
+            for response_text in response_texts:
+                dataset.extend(self._parse_dataset_response(response_text))
             
             logger.info(f"✅ 成功生成 {len(dataset)} 个多跳问答对")
             
@@ -307,16 +692,113 @@ class MultihopDatasetBuilder:
             valid_dataset = self._validate_dataset(dataset)
             logger.info(f"📊 验证通过: {len(valid_dataset)}/{len(dataset)} 个问答对")
             
+            if cache_path and valid_dataset:
+                self._write_response_cache(cache_path, valid_dataset)
+            
             return valid_dataset
             
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ JSON解析失败: {e}")
-            logger.debug(f"原始响应: {response_text[:500]}...")
-            return []
         except Exception as e:
             logger.error(f"❌ 数据集生成失败: {e}")
             return []
     
+    async def _call_llm(self, prompt: str, choices_per_call: int) -> List[str]:
+        """调用LLM并返回各候选结果文本，瞬时错误按带全抖动的指数退避重试，其他错误直接抛出"""
+        for attempt in range(self.retry_attempts):
+            try:
+                # 每次尝试都先申请限流额度
+                if self.rate_limiter:
+                    await self.rate_limiter.acquire(estimated_tokens=self._estimate_tokens(prompt))
+                
+                # 支持n参数的客户端一次请求返回多个候选结果，共享连接开销并只占用一个RPM额度
+                if choices_per_call > 1 and self.llm_type == 'litellm':
+                    response = await self.llm_client.ainvoke(prompt, n=choices_per_call)
+                    # 响应不含choices时按单个候选结果处理
+                    choices = getattr(response, 'choices', None)
+                    if choices:
+                        return [choice.content for choice in choices]
+                    return [response.content]
+                return [await self.llm_client.achat(prompt)]
+            except Exception as e:
+                if attempt + 1 >= self.retry_attempts or not _is_transient_llm_error(e):
+                    raise
+                # 全抖动：在 [0, min(cap, base*2^attempt)) 内随机等待，避免并发请求同时重试
+                delay = min(self.retry_backoff_cap, self.retry_backoff_base * 2 ** attempt) * random.random()
+                logger.warning(f"⚠️ LLM调用失败（第 {attempt + 1}/{self.retry_attempts} 次），{delay:.1f}秒后重试: {e}")
+                await asyncio.sleep(delay)
+        return []
+    
+    def _parse_dataset_response(self, response: str) -> List[Dict[str, Any]]:
+        """解析单个LLM响应中的JSON数组，解析失败时返回空列表"""
+        # 解析JSON响应
+        response_text = response.strip()
+        
+        # 尝试提取JSON部分
+        if "```json" in response_text:
+            start = response_text.find("```json") + 7
+            end = response_text.find("```", start)
+            if end != -1:
+                response_text = response_text[start:end].strip()
+        
+        try:
+            dataset = _json_loads(response_text)
+        except json.JSONDecodeError as e:
+            dataset = self._repair_json_array(response_text)
+            if dataset is None:
+                logger.error(f"❌ JSON解析失败: {e}")
+                logger.debug(f"原始响应: {response_text[:500]}...")
+                return []
+            logger.warning(f"⚠️ JSON响应不完整，已修复并保留 {len(dataset)} 个问答对")
+        
+        if not isinstance(dataset, list):
+            logger.error("❌ 响应格式错误：期望JSON数组")
+            return []
+        
+        return dataset
+    
+    @staticmethod
+    def _repair_json_array(response_text: str) -> Optional[List[Any]]:
+        """尝试修复被截断或带尾随内容的JSON数组，无法修复时返回None"""
+        start = response_text.find('[')
+        if start == -1:
+            return None
+        text = response_text[start:]
+        # 先截断到最后一个 ]（去除尾随内容），再尝试截断到最后一个完整对象并补全 ]
+        candidates = []
+        end = text.rfind(']')
+        if end != -1:
+            candidates.append(text[:end + 1])
+        end = text.rfind('}')
+        if end != -1:
+            candidates.append(text[:end + 1] + ']')
+        for candidate in candidates:
+            try:
+                dataset = _json_loads(candidate)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(dataset, list):
+                return dataset
+        return None
+    
+    def _response_cache_path(self, prompt: str) -> Optional[Path]:
+        """LLM响应缓存文件路径，未启用 multihop.cache_responses 时返回None
+        
+        启用后相同提示词直接复用历史生成结果，重复运行不会产生新样本，因此默认关闭。
+        """
+        if not self.config.get('multihop', {}).get('cache_responses', False):
+            return None
+        cache_dir = self.config.get('system', {}).get('workspace', {}).get('cache_dir', './workspace/cache')
+        key = hashlib.blake2b(f"{self.llm_signature}|{prompt}".encode('utf-8'), digest_size=16).hexdigest()
+        return Path(cache_dir) / "multihop_responses" / f"{key}.json"
+    
+    def _write_response_cache(self, cache_path: Path, dataset: List[Dict[str, Any]]) -> None:
+        """写入LLM响应缓存"""
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                f.write(_json_dumps(dataset))
+        except Exception as e:
+            logger.warning(f"⚠️ 响应缓存写入失败: {e}")
+    
     def _validate_dataset(self, dataset: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """验证数据集质量"""
         valid_items = []
@@ -350,20 +832,47 @@ class MultihopDatasetBuilder:
         
         return valid_items
     
-    async def save_dataset(self, dataset: List[Dict[str, Any]], output_path: str) -> None:
-        """保存数据集到文件"""
+    async def save_dataset(self, 
+                           dataset: Union[Iterable[Dict[str, Any]], AsyncIterable[Dict[str, Any]]], 
+                           output_path: str) -> int:
+        """保存数据集到文件
+        
+        逐条写入JSON数组，传入异步迭代器时边生成边落盘，无需在内存中保留整个数据集。
+        
+        Returns:
+            写入的问答对数量
+        """
+        count = 0
         try:
             output_path = Path(output_path)
             output_path.parent.mkdir(parents=True, exist_ok=True)
             
             with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(dataset, f, ensure_ascii=False, indent=2)
+                f.write("[")
+                
+                def _write_item(item: Dict[str, Any]) -> None:
+                    nonlocal count
+                    f.write(",\n" if count else "\n")
+                    f.write(textwrap.indent(_json_dumps(item, indent=True), "  "))
+                    f.flush()
+                    count += 1
+                
+                if hasattr(dataset, '__aiter__'):
+                    async for item in dataset:
+                        _write_item(item)
+                else:
+                    for item in dataset:
+                        _write_item(item)
+                
+                f.write("\n]" if count else "]")
             
             logger.info(f"💾 数据集已保存到: {output_path}")
-            logger.info(f"📊 数据集统计: {len(dataset)} 个问答对")
+            logger.info(f"📊 数据集统计: {count} 个问答对")
             
         except Exception as e:
             logger.error(f"❌ 保存数据集失败: {e}")
+        
+        return count
     
     async def build_dataset(self, 
                           data_path: str,
@@ -393,87 +902,23 @@ class MultihopDatasetBuilder:
                 logger.error("❌ 没有成功加载任何文档")
                 return
             
-            # 3. 生成数据集
-            dataset = await self.generate_dataset(documents, domain_config)
+            # 3. 生成数据集并边生成边保存
+            saved_count = await self.save_dataset(
+                self.iter_dataset(documents, domain_config),
+                output_path
+            )
             
-            if not dataset:
+            if not saved_count:
                 logger.error("❌ 数据集生成失败")
                 return
             
-            # 4. 保存数据集
-            await self.save_dataset(dataset, output_path)
-            
             logger.info("🎉 多跳数据集构建完成！")
             
         except Exception as e:
             logger.error(f"❌ 数据集构建失败: {e}")
+        finally:
+            await self.close()
     
-    async def load_documents(self, data_path: str, file_types: List[str] = None) -> List[Document]:
-        """加载文档（复用main.py中的逻辑）"""
-        documents = []
-        data_path = Path(data_path)
-        
-        if file_types is None:
-            file_types = ['pdf', 'txt', 'md', 'json', 'csv']
-        
-        # 获取文件列表
-        if data_path.is_file():
-            file_paths = [data_path]
-        elif data_path.is_dir():
-            file_paths = []
-            for file_type in file_types:
-                file_paths.extend(data_path.glob(f"*.{file_type}"))
-                file_paths.extend(data_path.glob(f"**/*.{file_type}"))
-        else:
-            logger.error(f"❌ 数据路径不存在: {data_path}")
-            return []
-        
-        logger.info(f"📄 发现 {len(file_paths)} 个文档文件")
-        
-        # 加载文档
-        reader_config = self.config['knowledge']['readers']
-        
-        for file_path in file_paths:
-            try:
-                # 根据文件类型选择读取器
-                if file_path.suffix.lower() == '.pdf' and reader_config['pdf']['enabled']:
-                    pdf_config = reader_config['pdf'].copy()
-                    pdf_config.pop('enabled', None)
-                    reader = PDFReader(**pdf_config)
-                elif file_path.suffix.lower() in ['.txt', '.md'] and reader_config['text']['enabled']:
-                    text_config = reader_config['text'].copy()
-                    text_config.pop('enabled', None)
-                    reader = TextReader(**text_config)
-                elif file_path.suffix.lower() == '.json' and reader_config['json']['enabled']:
-                    json_config = reader_config['json'].copy()
-                    json_config.pop('enabled', None)
-                    reader = JSONReader(**json_config)
-                elif file_path.suffix.lower() == '.csv' and reader_config['csv']['enabled']:
-                    csv_config = reader_config['csv'].copy()
-                    csv_config.pop('enabled', None)
-                    reader = CSVReader(**csv_config)
-                else:
-                    logger.warning(f"⚠️ 不支持的文件类型: {file_path}")
-                    continue
-                
-                # 读取文档
-                result = await reader.read(str(file_path))
-                
-                # 处理返回结果
-                if isinstance(result, list):
-                    for doc in result:
-                        documents.append(doc)
-                        logger.debug(f"📄 加载文档: {file_path.name}")
-                else:
-                    documents.append(result)
-                    logger.debug(f"📄 加载文档: {file_path.name}")
-                
-            except Exception as e:
-                logger.error(f"❌ 加载文档失败 {file_path}: {e}")
-                continue
-        
-        logger.info(f"📚 总计加载 {len(documents)} 个文档")
-        return documents
 
 
 def create_domain_config(domain: str) -> Dict[str, Any]:
@@ -592,4 +1037,5 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # 运行异步主函数（优先使用uvloop事件循环）
+    run_async(main())
\ No newline at end of file
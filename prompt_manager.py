@@ -5,22 +5,52 @@
 
 import os
 import yaml
-from typing import Dict, Any, Optional
+import string
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple
 from loguru import logger
 
+_FORMATTER = string.Formatter()
+
+# 优先使用 libyaml 的C实现解析
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# 内存中缓存的提示词数量上限（LRU淘汰）
+PROMPTS_CACHE_MAXSIZE = 128
+
+
+def _compile_template(template: str) -> Optional[List[Tuple[str, Optional[str]]]]:
+    """将 str.format 模板预解析为 (字面文本, 变量名) 片段列表
+    
+    仅支持简单的 {name} 占位符；包含格式说明、转换或属性/下标访问时返回 None，由调用方回退到 str.format。
+    """
+    segments = []
+    for literal, field_name, format_spec, conversion in _FORMATTER.parse(template):
+        if field_name is not None and (format_spec or conversion or not field_name.isidentifier()):
+            return None
+        segments.append((literal, field_name))
+    return segments
+
 
 class PromptManager:
     """提示词管理器"""
     
-    def __init__(self, prompts_dir: str = "prompts"):
+    def __init__(self, prompts_dir: str = "prompts", cache_maxsize: int = PROMPTS_CACHE_MAXSIZE):
         self.prompts_dir = prompts_dir
-        self.prompts_cache = {}
+        # 提示词名称 -> (文件mtime, 提示词配置)，按最近使用排序
+        self.prompts_cache = OrderedDict()
+        self.cache_maxsize = cache_maxsize
+        # 预解析的模板片段，键为 (prompt_name, template_key)
+        self._compiled_templates = {}
         
         # 确保prompts目录存在
         if not os.path.exists(self.prompts_dir):
             os.makedirs(self.prompts_dir)
             logger.info(f"📁 创建提示词目录: {self.prompts_dir}")
         
+        # 提示词名称 -> 文件路径
+        self._prompt_paths = self._scan_prompts()
+        
         logger.info(f"🔧 提示词管理器初始化完成，目录: {self.prompts_dir}")
     
     def load_prompt(self, prompt_name: str) -> Dict[str, Any]:
@@ -32,20 +62,31 @@ class PromptManager:
         Returns:
             提示词配置字典
         """
-        if prompt_name in self.prompts_cache:
-            return self.prompts_cache[prompt_name]
+        prompt_file = self._prompt_paths.get(prompt_name)
         
-        prompt_file = os.path.join(self.prompts_dir, f"{prompt_name}.yml")
-        
-        if not os.path.exists(prompt_file):
-            logger.error(f"❌ 提示词文件不存在: {prompt_file}")
+        if prompt_file is None:
+            logger.error(f"❌ 提示词文件不存在: {os.path.join(self.prompts_dir, f'{prompt_name}.yml')}")
             return {}
         
         try:
-            with open(prompt_file, 'r', encoding='utf-8') as f:
-                prompt_config = yaml.safe_load(f)
+            mtime = os.path.getmtime(prompt_file)
+        except OSError:
+            mtime = None
+        
+        cached = self.prompts_cache.get(prompt_name)
+        if cached is not None:
+            if cached[0] == mtime:
+                self.prompts_cache.move_to_end(prompt_name)
+                return cached[1]
+            # 文件已修改，丢弃旧配置及其预解析模板
+            self._evict(prompt_name)
+        
+        try:
+            prompt_config = self._load_prompt_file(prompt_file)
             
-            self.prompts_cache[prompt_name] = prompt_config
+            self.prompts_cache[prompt_name] = (mtime, prompt_config)
+            if len(self.prompts_cache) > self.cache_maxsize:
+                self._evict(next(iter(self.prompts_cache)))
             logger.debug(f"📄 加载提示词文件: {prompt_name}")
             
             return prompt_config
@@ -54,6 +95,17 @@ class PromptManager:
             logger.error(f"❌ 加载提示词文件失败 {prompt_file}: {e}")
             return {}
     
+    def _evict(self, prompt_name: str) -> None:
+        """从缓存中移除提示词及其预解析模板"""
+        self.prompts_cache.pop(prompt_name, None)
+        for cache_key in [k for k in self._compiled_templates if k[0] == prompt_name]:
+            del self._compiled_templates[cache_key]
+    
+    def _load_prompt_file(self, prompt_file: str) -> Dict[str, Any]:
+        """解析提示词文件（解析结果仅缓存在进程内的 prompts_cache 中）"""
+        with open(prompt_file, 'r', encoding='utf-8') as f:
+            return yaml.load(f, Loader=_YAML_LOADER)
+    
     def get_prompt_template(self, prompt_name: str, template_key: str = "template") -> str:
         """获取提示词模板，支持嵌套路径访问
         
@@ -116,8 +168,25 @@ class PromptManager:
         if not template:
             return ""
         
+        cache_key = (prompt_name, template_key)
+        if cache_key not in self._compiled_templates:
+            try:
+                self._compiled_templates[cache_key] = _compile_template(template)
+            except ValueError:
+                # 模板语法有误（如未配对的花括号）时回退到 str.format，由下方统一记录错误并返回原模板
+                self._compiled_templates[cache_key] = None
+        segments = self._compiled_templates[cache_key]
+        
         try:
-            formatted_prompt = template.format(**kwargs)
+            if segments is None:
+                formatted_prompt = template.format(**kwargs)
+            else:
+                parts = []
+                for literal, field_name in segments:
+                    parts.append(literal)
+                    if field_name is not None:
+                        parts.append(format(kwargs[field_name]))
+                formatted_prompt = "".join(parts)
             logger.debug(f"✅ 提示词格式化完成: {prompt_name}.{template_key}")
             return formatted_prompt
             
@@ -128,19 +197,28 @@ class PromptManager:
             logger.error(f"❌ 提示词格式化失败: {e}")
             return template
     
+    def _scan_prompts(self) -> Dict[str, str]:
+        """单次扫描提示词目录，建立名称到文件路径的映射（同名时 .yml 优先）"""
+        prompt_paths = {}
+        if not os.path.isdir(self.prompts_dir):
+            return prompt_paths
+        
+        with os.scandir(self.prompts_dir) as entries:
+            for entry in entries:
+                name, ext = os.path.splitext(entry.name)
+                if ext not in ('.yml', '.yaml') or not entry.is_file():
+                    continue
+                if ext == '.yml' or name not in prompt_paths:
+                    prompt_paths[name] = entry.path
+        return prompt_paths
+    
     def list_prompts(self) -> list:
         """列出所有可用的提示词文件"""
-        if not os.path.exists(self.prompts_dir):
-            return []
-        
-        prompt_files = []
-        for file in os.listdir(self.prompts_dir):
-            if file.endswith('.yml') or file.endswith('.yaml'):
-                prompt_files.append(file[:-4])  # 移除扩展名
-        
-        return prompt_files
+        return list(self._prompt_paths)
     
     def reload_prompts(self):
-        """重新加载所有提示词（清除缓存）"""
+        """重新加载所有提示词（清除缓存并重新扫描目录）"""
         self.prompts_cache.clear()
+        self._compiled_templates.clear()
+        self._prompt_paths = self._scan_prompts()
         logger.info("🔄 提示词缓存已清除")
\ No newline at end of file
@@ -5,14 +5,28 @@
 支持多跳推理查询的自动分解和并行检索
 """
 
+import re
 import json
 import asyncio
+from functools import lru_cache
 from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
 from pathlib import Path
 import yaml
 from loguru import logger
 
+try:
+    import numpy as np
+except ImportError:
+    # 未安装numpy时使用Python排序合并结果
+    np = None
+
+try:
+    import ahocorasick
+except ImportError:
+    # 未安装pyahocorasick时逐个子串匹配复杂度指标
+    ahocorasick = None
+
 try:
     import json_repair
 except ImportError:
@@ -23,146 +37,27 @@ from agenticx.llms import LlmFactory
 from agenticx.knowledge.graphers.config import LLMConfig
 
 
-@dataclass
-class SubQuestion:
-    """子问题数据结构"""
-    question: str
-    confidence: float
-    reasoning_type: str  # "factual", "relational", "comparative", "temporal"
-    entities: List[str]
-    relations: List[str]
-    priority: int = 1  # 1-高优先级, 2-中优先级, 3-低优先级
+# 中文字符（CJK统一表意文字基本区），用于检测查询语言
+_CJK_RE = re.compile(r'[\u4e00-\u9fff]')
 
+# 合并条目的结构化数组布局：子问题序号、结果位置、原始分数、分数权重
+_MERGE_ENTRY_DTYPE = [
+    ('sub_index', 'i4'),
+    ('position', 'i4'),
+    ('score', 'f8'),
+    ('weight', 'f8'),
+]
 
-@dataclass
-class DecompositionResult:
-    """查询分解结果"""
-    original_query: str
-    sub_questions: List[SubQuestion]
-    decomposition_confidence: float
-    reasoning_complexity: str  # "simple", "medium", "complex"
-    involved_types: Dict[str, List[str]]
-    decomposition_strategy: str
-    should_decompose: bool
+# 结果去重时参与比较的内容前缀长度
+_DEDUP_PREFIX_LENGTH = 100
 
+# 查询在提示词模板中的占位标记，用于将预渲染的提示词拆分为前后缀
+_QUERY_PLACEHOLDER = "\x00query\x00"
 
-class QueryDecomposer:
-    """
-    智能查询分解器
-    基于youtu-graphrag的agentic_decomposer思想，结合AgenticX框架
-    """
-    
-    def __init__(self, config: Dict[str, Any], schema_path: Optional[str] = None):
-        """初始化查询分解器"""
-        self.config = config
-        self.decomposition_config = config.get('retrieval', {}).get('query_decomposition', {})
-        self.schema_path = schema_path or "schema.json"
-        
-        # 初始化LLM客户端
-        llm_config = config.get('llm', {})
-        decomposition_model = self.decomposition_config.get('decomposition_model', 'qwen3-max')
-        
-        # 使用强模型进行查询分解
-        strong_model_config = config.get('llm', {}).get('strong_model', llm_config)
-        
-        # 创建LLMConfig对象
-        llm_config_obj = LLMConfig(
-            type=strong_model_config.get('provider', 'bailian'),
-            model=decomposition_model,
-            api_key=strong_model_config.get('api_key'),
-            base_url=strong_model_config.get('base_url'),
-            timeout=strong_model_config.get('timeout'),
-            max_retries=strong_model_config.get('max_retries'),
-            temperature=strong_model_config.get('temperature'),
-            max_tokens=strong_model_config.get('max_tokens')
-        )
-        
-        self.llm_client = LlmFactory.create_llm(llm_config_obj)
-        
-        # 分解配置参数
-        self.enable_decomposition = self.decomposition_config.get('enable_decomposition', True)
-        self.decomposition_count = self.decomposition_config.get('decomposition_count', 3)
-        self.min_query_length = self.decomposition_config.get('min_query_length', 10)
-        self.confidence_threshold = self.decomposition_config.get('confidence_threshold', 0.7)
-        self.enable_schema_aware = self.decomposition_config.get('enable_schema_aware', True)
-        self.enable_entity_focus = self.decomposition_config.get('enable_entity_focus', True)
-        self.fallback_to_original = self.decomposition_config.get('fallback_to_original', True)
-        
-        # 加载图模式
-        self.schema = self._load_schema()
-        
-        logger.info(f"查询分解器初始化完成，模型: {decomposition_model}")
-
-    def _load_schema(self) -> str:
-        """加载图模式"""
-        try:
-            if Path(self.schema_path).exists():
-                with open(self.schema_path, 'r', encoding='utf-8') as f:
-                    schema_data = json.load(f)
-                    return json.dumps(schema_data, ensure_ascii=False, indent=2)
-            else:
-                logger.warning(f"Schema文件不存在: {self.schema_path}")
-                return "{}"
-        except Exception as e:
-            logger.error(f"加载Schema失败: {e}")
-            return "{}"
-
-    def _analyze_query_complexity(self, query: str) -> Tuple[str, float]:
-        """分析查询复杂度"""
-        # 简单启发式规则
-        complexity_indicators = {
-            'simple': ['是什么', '什么是', '定义', '介绍'],
-            'medium': ['如何', '为什么', '原因', '方法', '过程'],
-            'complex': ['比较', '对比', '哪个更', '最', '关系', '影响', '导致']
-        }
-        
-        query_lower = query.lower()
-        
-        # 检查复杂度指标
-        for complexity, indicators in complexity_indicators.items():
-            if any(indicator in query_lower for indicator in indicators):
-                confidence = 0.8 if complexity == 'complex' else 0.6
-                return complexity, confidence
-        
-        # 基于查询长度判断
-        if len(query) > 50:
-            return 'complex', 0.7
-        elif len(query) > 20:
-            return 'medium', 0.6
-        else:
-            return 'simple', 0.5
-
-    def _should_decompose(self, query: str) -> bool:
-        """判断是否需要分解查询"""
-        if not self.enable_decomposition:
-            return False
-            
-        if len(query) < self.min_query_length:
-            return False
-            
-        complexity, confidence = self._analyze_query_complexity(query)
-        
-        # 复杂查询需要分解
-        if complexity in ['medium', 'complex'] and confidence > 0.6:
-            return True
-            
-        # 包含多个实体或关系的查询
-        entity_keywords = ['和', '与', '以及', '还有', '对比', '比较']
-        if any(keyword in query for keyword in entity_keywords):
-            return True
-            
-        return False
-
-    def should_decompose(self, query: str) -> bool:
-        """公共方法：判断是否需要分解查询"""
-        return self._should_decompose(query)
-
-    def _create_decomposition_prompt(self, query: str, language: str = "chinese") -> str:
-        """创建分解提示词"""
-        if language == "chinese":
-            return f"""
+# 查询分解提示词模板（中文）
+_DECOMPOSITION_PROMPT_CN = """
 你是一个专业的问题分解大师，擅长将复杂问题分解为简单的子问题。
-请根据以下问题和图本体模式，将问题分解为{self.decomposition_count}个子问题。
+请根据以下问题和图本体模式，将问题分解为{decomposition_count}个子问题。
 
 核心要求：
 1. 每个子问题必须：
@@ -186,7 +81,7 @@ class QueryDecomposer:
 原始问题：{query}
 
 图本体模式：
-{self.schema}
+{schema}
 
 示例输出：
 {{
@@ -215,10 +110,11 @@ class QueryDecomposer:
     }}
 }}
 """
-        else:
-            return f"""
+
+# 查询分解提示词模板（英文）
+_DECOMPOSITION_PROMPT_EN = """
 You are a professional question decomposition expert specializing in multi-hop reasoning.
-Given the following schema and question, decompose the complex question into {self.decomposition_count} focused sub-questions.
+Given the following schema and question, decompose the complex question into {decomposition_count} focused sub-questions.
 
 CRITICAL REQUIREMENTS:
 1. Each sub-question must be:
@@ -242,7 +138,7 @@ CRITICAL REQUIREMENTS:
 Original Question: {query}
 
 Graph Schema:
-{self.schema}
+{schema}
 
 Example Output:
 {{
@@ -272,6 +168,241 @@ Example Output:
 }}
 """
 
+
+def _content_key(result: Any) -> str:
+    """检索结果的去重键（内容前缀字符串，其哈希值由str对象自身缓存）"""
+    return getattr(result, 'content', str(result))[:_DEDUP_PREFIX_LENGTH]
+
+
+# 查询复杂度指标（按 simple -> medium -> complex 顺序匹配）
+_COMPLEXITY_INDICATORS = {
+    'simple': ('是什么', '什么是', '定义', '介绍'),
+    'medium': ('如何', '为什么', '原因', '方法', '过程'),
+    'complex': ('比较', '对比', '哪个更', '最', '关系', '影响', '导致')
+}
+
+_COMPLEXITY_LEVELS = tuple(_COMPLEXITY_INDICATORS)
+
+
+def _build_complexity_automaton():
+    """构建复杂度指标的Aho-Corasick自动机，值为复杂度级别序号（未安装时返回None）"""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for rank, indicators in enumerate(_COMPLEXITY_INDICATORS.values()):
+        for indicator in indicators:
+            if not automaton.exists(indicator):
+                automaton.add_word(indicator, rank)
+    automaton.make_automaton()
+    return automaton
+
+
+_COMPLEXITY_AUTOMATON = _build_complexity_automaton()
+
+# 表示查询包含多个实体或关系的关键词
+_MULTI_ENTITY_KEYWORDS = ('和', '与', '以及', '还有', '对比', '比较')
+
+
+@lru_cache(maxsize=2048)
+def _analyze_query_complexity_cached(query: str) -> Tuple[str, float]:
+    """分析查询复杂度（纯函数，按查询缓存结果）"""
+    # 简单启发式规则
+    query_lower = query.lower()
+    
+    # 检查复杂度指标：多个级别同时命中时按 simple -> medium -> complex 的顺序取第一个
+    if _COMPLEXITY_AUTOMATON is not None:
+        # 单次扫描查询即可得到全部命中的指标
+        rank = min((rank for _, rank in _COMPLEXITY_AUTOMATON.iter(query_lower)), default=None)
+        if rank is not None:
+            complexity = _COMPLEXITY_LEVELS[rank]
+            return complexity, 0.8 if complexity == 'complex' else 0.6
+    else:
+        for complexity, indicators in _COMPLEXITY_INDICATORS.items():
+            if any(indicator in query_lower for indicator in indicators):
+                confidence = 0.8 if complexity == 'complex' else 0.6
+                return complexity, confidence
+    
+    # 基于查询长度判断
+    if len(query) > 50:
+        return 'complex', 0.7
+    elif len(query) > 20:
+        return 'medium', 0.6
+    else:
+        return 'simple', 0.5
+
+
+@lru_cache(maxsize=2048)
+def _should_decompose_cached(query: str, enable_decomposition: bool, min_query_length: int) -> bool:
+    """判断是否需要分解查询（纯函数，配置作为参数参与缓存键，不缓存实例）"""
+    if not enable_decomposition:
+        return False
+        
+    if len(query) < min_query_length:
+        return False
+        
+    complexity, confidence = _analyze_query_complexity_cached(query)
+    
+    # 复杂查询需要分解
+    if complexity in ['medium', 'complex'] and confidence > 0.6:
+        return True
+        
+    # 包含多个实体或关系的查询
+    if any(keyword in query for keyword in _MULTI_ENTITY_KEYWORDS):
+        return True
+        
+    return False
+
+
+@dataclass(slots=True)
+class SubQuestion:
+    """子问题数据结构"""
+    question: str
+    confidence: float
+    reasoning_type: str  # "factual", "relational", "comparative", "temporal"
+    entities: List[str]
+    relations: List[str]
+    priority: int = 1  # 1-高优先级, 2-中优先级, 3-低优先级
+
+
+@dataclass(slots=True)
+class DecompositionResult:
+    """查询分解结果"""
+    original_query: str
+    sub_questions: List[SubQuestion]
+    decomposition_confidence: float
+    reasoning_complexity: str  # "simple", "medium", "complex"
+    involved_types: Dict[str, List[str]]
+    decomposition_strategy: str
+    should_decompose: bool
+
+
+def _clean_json_response(text: str) -> str:
+    """移除LLM响应中的markdown代码块标记"""
+    return (
+        text.strip()
+        .removeprefix('```json')
+        .removeprefix('```')
+        .removesuffix('```')
+        .strip()
+    )
+
+
+def _build_sub_questions(items: List[Dict[str, Any]]) -> List[SubQuestion]:
+    """由解析后的JSON构建子问题列表，优先级按出现顺序递增"""
+    return [
+        SubQuestion(
+            question=sub_q.get('question', ''),
+            confidence=sub_q.get('confidence', 0.5),
+            reasoning_type=sub_q.get('reasoning_type', 'factual'),
+            entities=sub_q.get('entities', []),
+            relations=sub_q.get('relations', []),
+            priority=i
+        )
+        for i, sub_q in enumerate(items, 1)
+    ]
+
+
+class QueryDecomposer:
+    """
+    智能查询分解器
+    基于youtu-graphrag的agentic_decomposer思想，结合AgenticX框架
+    """
+    
+    def __init__(self, config: Dict[str, Any], schema_path: Optional[str] = None):
+        """初始化查询分解器"""
+        self.config = config
+        self.decomposition_config = config.get('retrieval', {}).get('query_decomposition', {})
+        self.schema_path = schema_path or "schema.json"
+        
+        # 初始化LLM客户端
+        llm_config = config.get('llm', {})
+        decomposition_model = self.decomposition_config.get('decomposition_model', 'qwen3-max')
+        
+        # 使用强模型进行查询分解
+        strong_model_config = config.get('llm', {}).get('strong_model', llm_config)
+        
+        # 创建LLMConfig对象
+        llm_config_obj = LLMConfig(
+            type=strong_model_config.get('provider', 'bailian'),
+            model=decomposition_model,
+            api_key=strong_model_config.get('api_key'),
+            base_url=strong_model_config.get('base_url'),
+            timeout=strong_model_config.get('timeout'),
+            max_retries=strong_model_config.get('max_retries'),
+            temperature=strong_model_config.get('temperature'),
+            max_tokens=strong_model_config.get('max_tokens')
+        )
+        
+        self.llm_client = LlmFactory.create_llm(llm_config_obj)
+        
+        # 分解配置参数
+        self.enable_decomposition = self.decomposition_config.get('enable_decomposition', True)
+        self.decomposition_count = self.decomposition_config.get('decomposition_count', 3)
+        self.min_query_length = self.decomposition_config.get('min_query_length', 10)
+        self.confidence_threshold = self.decomposition_config.get('confidence_threshold', 0.7)
+        self.enable_schema_aware = self.decomposition_config.get('enable_schema_aware', True)
+        self.enable_entity_focus = self.decomposition_config.get('enable_entity_focus', True)
+        self.fallback_to_original = self.decomposition_config.get('fallback_to_original', True)
+        
+        # 并行检索时同时执行的子问题数上限，避免突发请求触发检索端限流
+        self.max_concurrent_sub_queries = self.decomposition_config.get('max_concurrent_sub_queries', 8)
+        # 信号量在首次使用时于运行中的事件循环内创建，跨 asyncio.run 复用实例时随事件循环重建
+        self._sub_query_semaphore = None
+        self._sub_query_semaphore_loop = None
+        
+        # 加载图模式
+        self.schema = self._load_schema()
+        
+        # 除查询外提示词内容固定，初始化时预渲染一次
+        self._prompt_prefix_cn, self._prompt_suffix_cn = self._build_prompt_parts(_DECOMPOSITION_PROMPT_CN)
+        self._prompt_prefix_en, self._prompt_suffix_en = self._build_prompt_parts(_DECOMPOSITION_PROMPT_EN)
+        
+        logger.info(f"查询分解器初始化完成，模型: {decomposition_model}")
+
+    def _load_schema(self) -> str:
+        """加载图模式（直接使用文件中的JSON文本，仅解析一次校验格式）"""
+        try:
+            schema_file = Path(self.schema_path)
+            if schema_file.exists():
+                schema_text = schema_file.read_text(encoding='utf-8').strip()
+                json.loads(schema_text)
+                return schema_text
+            else:
+                logger.warning(f"Schema文件不存在: {self.schema_path}")
+                return "{}"
+        except Exception as e:
+            logger.error(f"加载Schema失败: {e}")
+            return "{}"
+
+    def _analyze_query_complexity(self, query: str) -> Tuple[str, float]:
+        """分析查询复杂度"""
+        return _analyze_query_complexity_cached(query)
+
+    def _should_decompose(self, query: str) -> bool:
+        """判断是否需要分解查询"""
+        return _should_decompose_cached(query, self.enable_decomposition, self.min_query_length)
+
+    def should_decompose(self, query: str) -> bool:
+        """公共方法：判断是否需要分解查询"""
+        return self._should_decompose(query)
+
+    def _build_prompt_parts(self, template: str) -> Tuple[str, str]:
+        """预先渲染提示词模板，按查询位置拆分为 (前缀, 后缀)"""
+        rendered = template.format(
+            decomposition_count=self.decomposition_count,
+            schema=self.schema,
+            query=_QUERY_PLACEHOLDER
+        )
+        prefix, _, suffix = rendered.partition(_QUERY_PLACEHOLDER)
+        return prefix, suffix
+
+    def _create_decomposition_prompt(self, query: str, language: str = "chinese") -> str:
+        """创建分解提示词（仅拼接预渲染的前后缀与查询）"""
+        if language == "chinese":
+            return self._prompt_prefix_cn + query + self._prompt_suffix_cn
+        else:
+            return self._prompt_prefix_en + query + self._prompt_suffix_en
+
     async def decompose_query(self, query: str) -> DecompositionResult:
         """分解查询为子问题"""
         logger.info(f"开始分解查询: {query}")
@@ -298,7 +429,7 @@ Example Output:
         
         try:
             # 检测语言
-            language = "chinese" if any('\u4e00' <= char <= '\u9fff' for char in query) else "english"
+            language = "chinese" if _CJK_RE.search(query) else "english"
             
             # 创建分解提示词
             prompt = self._create_decomposition_prompt(query, language)
@@ -309,20 +440,14 @@ Example Output:
             # 解析响应
             try:
                 # 清理响应内容，移除markdown代码块标记
-                raw_content = response.content.strip()
-                
-                # 移除markdown代码块标记
-                if raw_content.startswith('```json'):
-                    raw_content = raw_content[7:]  # 移除 ```json
-                if raw_content.startswith('```'):
-                    raw_content = raw_content[3:]   # 移除 ```
-                if raw_content.endswith('```'):
-                    raw_content = raw_content[:-3]  # 移除结尾的 ```
-                
-                raw_content = raw_content.strip()
+                raw_content = _clean_json_response(response.content)
                 logger.debug(f"清理后的JSON内容: {raw_content[:200]}...")
                 
-                content = json_repair.loads(raw_content)
+                try:
+                    content = json.loads(raw_content)
+                except ValueError:
+                    # 格式不规范时再修复解析；修复较耗CPU，放到线程中执行以免阻塞事件循环
+                    content = await asyncio.to_thread(json_repair.loads, raw_content)
                 logger.info(f"✅ JSON解析成功")
             except Exception as e:
                 logger.error(f"❌ JSON解析失败: {e}")
@@ -334,17 +459,7 @@ Example Output:
                 raise
             
             # 构建子问题列表
-            sub_questions = []
-            for i, sub_q in enumerate(content.get('sub_questions', [])):
-                sub_question = SubQuestion(
-                    question=sub_q.get('question', ''),
-                    confidence=sub_q.get('confidence', 0.5),
-                    reasoning_type=sub_q.get('reasoning_type', 'factual'),
-                    entities=sub_q.get('entities', []),
-                    relations=sub_q.get('relations', []),
-                    priority=i + 1
-                )
-                sub_questions.append(sub_question)
+            sub_questions = _build_sub_questions(content.get('sub_questions', []))
             
             # 构建分解结果
             result = DecompositionResult(
@@ -406,15 +521,35 @@ Example Output:
         for i, sub_q in enumerate(decomposition_result.sub_questions, 1):
             logger.info(f"  {i}. [{sub_q.reasoning_type}] {sub_q.question} (置信度: {sub_q.confidence:.2f})")
         
+        sub_questions = decomposition_result.sub_questions
+        # 内容去重键 -> (子问题序号, 结果位置, 结果, 分数权重)
+        merged = {}
+        
         if parallel_retrieval:
             # 并行检索
             logger.info("🔄 执行并行检索...")
-            tasks = []
-            for sub_q in decomposition_result.sub_questions:
-                task = retriever.retrieve_single_query(sub_q.question)
-                tasks.append(task)
             
-            sub_results = await asyncio.gather(*tasks, return_exceptions=True)
+            semaphore = self._get_sub_query_semaphore()
+            
+            async def _bounded(index, sub_q):
+                async with semaphore:
+                    try:
+                        return index, await retriever.retrieve_single_query(sub_q.question)
+                    except Exception as e:
+                        return index, e
+            
+            tasks = [asyncio.create_task(_bounded(i, sub_q)) for i, sub_q in enumerate(sub_questions)]
+            sub_results = [[] for _ in sub_questions]
+            
+            # 按完成顺序逐个合并，合并计算与较慢子问题的检索重叠进行
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    index, result = await next_done
+                    sub_results[index] = result
+                    self._merge_incremental(result, index, sub_questions[index], merged)
+            finally:
+                for task in tasks:
+                    task.cancel()
         else:
             # 顺序检索
             logger.info("🔄 执行顺序检索...")
@@ -428,6 +563,9 @@ Example Output:
                 except Exception as e:
                     logger.error(f"  ❌ 子问题 {i} 检索失败: {e}")
                     sub_results.append([])
+            
+            for index, (result, sub_q) in enumerate(zip(sub_results, sub_questions)):
+                self._merge_incremental(result, index, sub_q, merged)
         
         # 记录每个子问题的检索统计
         logger.info("📊 子问题检索统计:")
@@ -444,12 +582,9 @@ Example Output:
         
         logger.info(f"📈 检索汇总: 总计{total_results}个结果来自{len(decomposition_result.sub_questions)}个子问题")
         
-        # 3. 合并结果
-        logger.info("🔀 开始合并子问题结果...")
-        merged_results = self._merge_sub_results(
-            sub_results, 
-            decomposition_result.sub_questions
-        )
+        # 3. 汇总合并结果（去重已在检索完成时增量进行）
+        logger.info("🔀 汇总子问题合并结果...")
+        merged_results = self._finalize_merged(merged)
         logger.info(f"✨ 合并完成: 最终获得{len(merged_results)}个去重后的结果")
         
         return merged_results, {
@@ -461,57 +596,96 @@ Example Output:
 
     def _merge_sub_results(self, sub_results: List[List[Any]], sub_questions: List[SubQuestion]) -> List[Any]:
         """合并子问题的检索结果"""
-        merge_strategy = self.decomposition_config.get('merge_strategy', 'weighted_score')
+        merged = {}
+        for index, (results, sub_q) in enumerate(zip(sub_results, sub_questions)):
+            self._merge_incremental(results, index, sub_q, merged)
+        return self._finalize_merged(merged)
+
+    def _get_sub_query_semaphore(self) -> asyncio.Semaphore:
+        """返回当前事件循环的子问题并发信号量（事件循环变化时重新创建）"""
+        loop = asyncio.get_running_loop()
+        if self._sub_query_semaphore_loop is not loop:
+            self._sub_query_semaphore = asyncio.Semaphore(max(1, self.max_concurrent_sub_queries))
+            self._sub_query_semaphore_loop = loop
+        return self._sub_query_semaphore
+
+    def _merge_incremental(self, results: Any, index: int, sub_q: SubQuestion, merged: Dict[str, Tuple[int, int, Any, float]]) -> None:
+        """将单个子问题的检索结果并入已合并结果
         
-        all_results = []
-        seen_contents = set()
+        重复内容保留序号更靠前的子问题的结果，使合并结果与子问题的完成顺序无关。
+        """
+        if isinstance(results, Exception):
+            logger.error(f"子问题检索异常: {results}")
+            return
+            
+        if not isinstance(results, list):
+            return
         
-        for i, (results, sub_q) in enumerate(zip(sub_results, sub_questions)):
-            if isinstance(results, Exception):
-                logger.error(f"子问题检索异常: {results}")
-                continue
-                
-            if not isinstance(results, list):
+        merge_strategy = self.decomposition_config.get('merge_strategy', 'weighted_score')
+        
+        for position, result in enumerate(results):
+            # 去重
+            content_key = _content_key(result)
+            existing = merged.get(content_key)
+            if existing is not None and existing[0] <= index:
                 continue
-                
-            for result in results:
-                # 去重
-                content_key = getattr(result, 'content', str(result))[:100]
-                if content_key in seen_contents:
-                    continue
-                seen_contents.add(content_key)
-                
-                # 根据合并策略调整分数
-                if merge_strategy == 'weighted_score':
-                    # 根据子问题置信度和优先级调整分数
-                    weight = sub_q.confidence * (1.0 / sub_q.priority)
-                    if hasattr(result, 'score'):
-                        result.score = result.score * weight
-                elif merge_strategy == 'relevance_ranking':
-                    # 保持原始分数，后续重新排序
-                    pass
-                
-                # 添加分解信息到元数据
-                if hasattr(result, 'metadata'):
-                    result.metadata.update({
-                        'sub_question': sub_q.question,
-                        'sub_question_confidence': sub_q.confidence,
-                        'reasoning_type': sub_q.reasoning_type,
-                        'decomposition_priority': sub_q.priority
-                    })
-                
-                all_results.append(result)
+            
+            # 根据合并策略确定分数权重（在汇总时统一计算加权分数）
+            weight = 1.0
+            if merge_strategy == 'weighted_score':
+                # 根据子问题置信度和优先级调整分数
+                weight = sub_q.confidence * (1.0 / sub_q.priority)
+            elif merge_strategy == 'relevance_ranking':
+                # 保持原始分数，后续重新排序
+                pass
+            
+            # 添加分解信息到元数据
+            if hasattr(result, 'metadata'):
+                result.metadata.update({
+                    'sub_question': sub_q.question,
+                    'sub_question_confidence': sub_q.confidence,
+                    'reasoning_type': sub_q.reasoning_type,
+                    'decomposition_priority': sub_q.priority
+                })
+            
+            merged[content_key] = (index, position, result, weight)
+
+    def _finalize_merged(self, merged: Dict[str, Tuple[int, int, Any, float]]) -> List[Any]:
+        """按加权分数排序合并结果并限制数量，同分时按子问题顺序及结果位置排列"""
+        merge_strategy = self.decomposition_config.get('merge_strategy', 'weighted_score')
+        max_results = self.decomposition_config.get('max_merged_results', 100)
         
-        # 排序和限制结果数量
-        if merge_strategy == 'weighted_score':
-            all_results.sort(key=lambda x: getattr(x, 'score', 0), reverse=True)
-        elif merge_strategy == 'relevance_ranking':
-            # 可以在这里实现更复杂的相关性排序
-            all_results.sort(key=lambda x: getattr(x, 'score', 0), reverse=True)
+        entries = list(merged.values())
         
-        # 限制结果数量
-        max_results = self.decomposition_config.get('max_merged_results', 100)
-        return all_results[:max_results]
+        if merge_strategy not in ('weighted_score', 'relevance_ranking'):
+            entries.sort(key=lambda entry: (entry[0], entry[1]))
+            return [entry[2] for entry in entries[:max_results]]
+        
+        if np is not None:
+            # 合并条目存为结构化数组，加权分数与多键排序均在numpy中一次完成
+            table = np.fromiter(
+                ((entry[0], entry[1], getattr(entry[2], 'score', 0), entry[3]) for entry in entries),
+                dtype=_MERGE_ENTRY_DTYPE, count=len(entries)
+            )
+            weighted = table['score'] * table['weight']
+            # lexsort以最后一个键为主键：加权分数降序，其次子问题序号、结果位置升序
+            order = np.lexsort((table['position'], table['sub_index'], -weighted))[:max_results].tolist()
+            final_scores = weighted.tolist()
+        else:
+            final_scores = [getattr(entry[2], 'score', 0) * entry[3] for entry in entries]
+            order = sorted(
+                range(len(entries)),
+                key=lambda i: (-final_scores[i], entries[i][0], entries[i][1])
+            )[:max_results]
+        
+        # 仅对最终保留的结果写回加权分数
+        top_results = []
+        for i in order:
+            result = entries[i][2]
+            if hasattr(result, 'score'):
+                result.score = final_scores[i]
+            top_results.append(result)
+        return top_results
 
     def get_decomposition_stats(self) -> Dict[str, Any]:
         """获取分解统计信息"""
@@ -6,17 +6,105 @@
 
 import re
 import warnings
+import threading
 # 过滤 pkg_resources 弃用警告
 warnings.filterwarnings("ignore", category=DeprecationWarning, module=".*pkg_resources.*")
 warnings.filterwarnings("ignore", message=".*pkg_resources.*")
 
-import jieba
+try:
+    # jieba_fast 为C扩展实现，接口与jieba一致
+    import jieba_fast as jieba
+except ImportError:
+    import jieba
+
+# 在后台线程中预先加载分词词典，与应用启动过程重叠
+threading.Thread(target=jieba.initialize, name="jieba-warmup", daemon=True).start()
+
 from typing import List, Dict, Any, Set, Optional
 from dataclasses import dataclass
 from loguru import logger
 
+try:
+    import ahocorasick
+except ImportError:
+    # 未安装pyahocorasick时逐个子串匹配实体后缀
+    ahocorasick = None
+
+
+# 常见的查询模式 - 🔧 增强版本，更好识别复杂查询（模块加载时预编译）
+_QUESTION_PATTERNS = (
+    (re.compile(r'(.+?)是什么'), 'definition'),
+    (re.compile(r'(.+?)是啥'), 'definition'),
+    (re.compile(r'什么是(.+?)'), 'definition'),
+    (re.compile(r'(.+?)怎么样'), 'evaluation'),
+    (re.compile(r'(.+?)如何'), 'method'),
+    (re.compile(r'(.+?)的作用'), 'function'),
+    (re.compile(r'(.+?)的特点'), 'feature'),
+    # 🔧 增强：更全面的复杂查询模式
+    (re.compile(r'(.+?)包含(.+?)方面'), 'specific_inquiry'),
+    (re.compile(r'(.+?)具体包含(.+?)'), 'specific_inquiry'),
+    (re.compile(r'(.+?)有哪些(.+?)'), 'enumeration'),
+    (re.compile(r'(.+?)分为(.+?)'), 'classification'),
+    (re.compile(r'(.+?)承诺(.+?)'), 'commitment_inquiry'),
+    (re.compile(r'(.+?)哪几个(.+?)'), 'enumeration'),          # 🔧 新增：哪几个
+    (re.compile(r'(.+?)几个方面(.+?)'), 'specific_inquiry'),    # 🔧 新增：几个方面
+    (re.compile(r'(.+?)方面的(.+?)'), 'specific_inquiry'),      # 🔧 新增：方面的
+    (re.compile(r'(.+?)包括(.+?)'), 'enumeration'),            # 🔧 新增：包括
+    (re.compile(r'(.+?)涉及(.+?)'), 'specific_inquiry'),       # 🔧 新增：涉及
+    (re.compile(r'(.+?)覆盖(.+?)'), 'specific_inquiry'),       # 🔧 新增：覆盖
+    (re.compile(r'(.+?)服务(.+?)'), 'service_inquiry'),        # 🔧 新增：服务相关
+    (re.compile(r'(.+?)保障(.+?)'), 'service_inquiry'),        # 🔧 新增：保障相关
+)
+
+# 实体抽取模式
+_ENTITY_PATTERNS = (
+    re.compile(r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)'),  # 英文实体
+    re.compile(r'([\u4e00-\u9fff]{2,}(?:公司|企业|集团|技术|系统|平台))'),  # 中文机构/技术实体
+    re.compile(r'([\u4e00-\u9fff]{2,})'),  # 一般中文实体
+)
+
+# 连续空白
+_WS_RE = re.compile(r'\s+')
+
+# 实体关键字 -> 扩展的相关词汇（按顺序优先匹配）
+_ENTITY_ENRICHMENTS = (
+    (('公司', '企业', '集团'), ('业务', '服务', '产品')),  # 公司名
+    (('技术', '系统', '平台'), ('应用', '功能', '特点')),  # 技术名
+)
+
 
-@dataclass
+def _build_enrichment_automaton():
+    """构建实体关键字的Aho-Corasick自动机，值为扩展词组序号（未安装时返回None）"""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for rank, (suffixes, _) in enumerate(_ENTITY_ENRICHMENTS):
+        for suffix in suffixes:
+            if not automaton.exists(suffix):
+                automaton.add_word(suffix, rank)
+    automaton.make_automaton()
+    return automaton
+
+
+_ENRICHMENT_AUTOMATON = _build_enrichment_automaton()
+
+# 全角标点统一为半角
+_PUNCT_TRANSLATE = str.maketrans({'？': '?', '！': '!'})
+
+# 常见的口语化表达
+_COLLOQUIAL_MAP = {
+    '是啥': '是什么',
+    '咋样': '怎么样',
+    '咋办': '怎么办',
+    '啥意思': '什么意思',
+}
+_COLLOQUIAL_RE = re.compile('|'.join(map(re.escape, _COLLOQUIAL_MAP)))
+
+# 分词结果中的标点和空白字符（全部由这些字符组成的词会被过滤）
+_PUNCT_SET = frozenset('？！。，、；："（）【】 \t\n\r\f\v')
+
+
+@dataclass(slots=True)
 class ProcessedQuery:
     """处理后的查询结果"""
     original: str
@@ -31,35 +119,16 @@ class ProcessedQuery:
 class ChineseQueryProcessor:
     """中文查询预处理器"""
     
-    def __init__(self):
-        """初始化处理器"""
-        # 初始化jieba分词
-        jieba.initialize()
+    def __init__(self, hmm: bool = True):
+        """初始化处理器
         
-        # 常见的查询模式 - 🔧 增强版本，更好识别复杂查询
-        self.question_patterns = {
-            r'(.+?)是什么': 'definition',
-            r'(.+?)是啥': 'definition', 
-            r'什么是(.+?)': 'definition',
-            r'(.+?)怎么样': 'evaluation',
-            r'(.+?)如何': 'method',
-            r'(.+?)的作用': 'function',
-            r'(.+?)的特点': 'feature',
-            # 🔧 增强：更全面的复杂查询模式
-            r'(.+?)包含(.+?)方面': 'specific_inquiry',
-            r'(.+?)具体包含(.+?)': 'specific_inquiry',
-            r'(.+?)有哪些(.+?)': 'enumeration',
-            r'(.+?)分为(.+?)': 'classification',
-            r'(.+?)承诺(.+?)': 'commitment_inquiry',
-            r'(.+?)哪几个(.+?)': 'enumeration',          # 🔧 新增：哪几个
-            r'(.+?)几个方面(.+?)': 'specific_inquiry',    # 🔧 新增：几个方面
-            r'(.+?)方面的(.+?)': 'specific_inquiry',      # 🔧 新增：方面的
-            r'(.+?)包括(.+?)': 'enumeration',            # 🔧 新增：包括
-            r'(.+?)涉及(.+?)': 'specific_inquiry',       # 🔧 新增：涉及
-            r'(.+?)覆盖(.+?)': 'specific_inquiry',       # 🔧 新增：覆盖
-            r'(.+?)服务(.+?)': 'service_inquiry',        # 🔧 新增：服务相关
-            r'(.+?)保障(.+?)': 'service_inquiry',        # 🔧 新增：保障相关
-        }
+        Args:
+            hmm: 分词时是否启用HMM新词发现；词典覆盖充分时关闭可明显提升分词速度
+        """
+        self.hmm = hmm
+        
+        # 初始化jieba分词（幂等；后台预加载未完成时等待其完成）
+        jieba.initialize()
         
         # 同义词词典
         self.synonyms = {
@@ -78,11 +147,11 @@ class ChineseQueryProcessor:
         }
         
         # 停用词
-        self.stop_words = {
+        self.stop_words = frozenset({
             '的', '了', '在', '是', '我', '有', '和', '就', '不', '人', 
             '都', '一', '一个', '上', '也', '很', '到', '说', '要', '去',
             '你', '会', '着', '没有', '看', '好', '自己', '这'
-        }
+        })
 
     def process_query(self, query: str) -> ProcessedQuery:
         """处理查询"""
@@ -127,24 +196,11 @@ class ChineseQueryProcessor:
 
     def _normalize_query(self, query: str) -> str:
         """标准化查询"""
-        # 去除多余空格
-        normalized = re.sub(r'\s+', ' ', query.strip())
-        
-        # 统一标点符号
-        normalized = normalized.replace('？', '?').replace('！', '!')
-        
-        # 处理常见的口语化表达
-        replacements = {
-            '是啥': '是什么',
-            '咋样': '怎么样',
-            '咋办': '怎么办',
-            '啥意思': '什么意思',
-        }
-        
-        for old, new in replacements.items():
-            normalized = normalized.replace(old, new)
+        # 去除多余空格并统一标点符号
+        normalized = _WS_RE.sub(' ', query.strip()).translate(_PUNCT_TRANSLATE)
         
-        return normalized
+        # 处理常见的口语化表达（单次扫描替换全部）
+        return _COLLOQUIAL_RE.sub(lambda m: _COLLOQUIAL_MAP[m.group(0)], normalized)
 
     def _identify_query_type(self, query: str) -> tuple[str, float]:
         """识别查询类型"""
@@ -158,8 +214,8 @@ class ChineseQueryProcessor:
         if any(word in query.lower() for word in meaningless) and len(query) < 10:
             return 'meaningless', 0.9
         
-        for pattern, query_type in self.question_patterns.items():
-            if re.search(pattern, query):
+        for pattern, query_type in _QUESTION_PATTERNS:
+            if pattern.search(query):
                 return query_type, 0.9
         
         # 基于关键词判断
@@ -180,42 +236,23 @@ class ChineseQueryProcessor:
 
     def _extract_keywords(self, query: str) -> List[str]:
         """提取关键词"""
-        # 使用jieba分词
-        words = list(jieba.cut(query))
-        
-        # 过滤停用词和短词
-        keywords = []
-        for word in words:
-            word = word.strip()
-            if (len(word) > 1 and 
-                word not in self.stop_words and 
-                not re.match(r'^[？！。，、；：""''（）【】 \t\n\r\f\v]+$', word)):
-                keywords.append(word)
-        
-        return keywords
+        # 使用jieba分词，过滤停用词、短词及纯标点
+        stop_words = self.stop_words
+        return [
+            word for word in map(str.strip, jieba.cut(query, HMM=self.hmm))
+            if len(word) > 1 and word not in stop_words and not _PUNCT_SET.issuperset(word)
+        ]
 
     def _extract_entities(self, query: str) -> List[str]:
         """提取实体"""
         entities = []
         
         # 基于模式匹配提取实体
-        patterns = [
-            r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)',  # 英文实体
-            r'([\u4e00-\u9fff]{2,}(?:公司|企业|集团|技术|系统|平台))',  # 中文机构/技术实体
-            r'([\u4e00-\u9fff]{2,})',  # 一般中文实体
-        ]
+        for pattern in _ENTITY_PATTERNS:
+            entities.extend(pattern.findall(query))
         
-        for pattern in patterns:
-            matches = re.findall(pattern, query)
-            entities.extend(matches)
-        
-        # 去重并过滤
-        unique_entities = []
-        for entity in entities:
-            if entity not in unique_entities and len(entity) > 1:
-                unique_entities.append(entity)
-        
-        return unique_entities
+        # 去重并过滤（保持顺序）
+        return [entity for entity in dict.fromkeys(entities) if len(entity) > 1]
 
     def _expand_query(self, keywords: List[str], entities: List[str]) -> List[str]:
         """扩展查询词汇"""
@@ -226,14 +263,17 @@ class ChineseQueryProcessor:
             if keyword in self.synonyms:
                 expanded.update(self.synonyms[keyword])
         
-        # 添加相关词汇
+        # 添加相关词汇：公司名优先于技术名，每个实体只扩展一组
         for entity in entities:
-            # 如果是公司名，添加相关词汇
-            if any(suffix in entity for suffix in ['公司', '企业', '集团']):
-                expanded.update(['业务', '服务', '产品'])
-            # 如果是技术名，添加相关词汇
-            elif any(suffix in entity for suffix in ['技术', '系统', '平台']):
-                expanded.update(['应用', '功能', '特点'])
+            if _ENRICHMENT_AUTOMATON is not None:
+                rank = min((rank for _, rank in _ENRICHMENT_AUTOMATON.iter(entity)), default=None)
+                if rank is not None:
+                    expanded.update(_ENTITY_ENRICHMENTS[rank][1])
+                continue
+            for suffixes, related_terms in _ENTITY_ENRICHMENTS:
+                if any(suffix in entity for suffix in suffixes):
+                    expanded.update(related_terms)
+                    break
         
         return list(expanded)
 
@@ -265,13 +305,8 @@ class ChineseQueryProcessor:
             if important_terms:
                 queries.append(' '.join(important_terms[:3]))  # 最多3个扩展词
         
-        # 去重
-        unique_queries = []
-        for query in queries:
-            if query not in unique_queries:
-                unique_queries.append(query)
-        
-        return unique_queries
+        # 保持顺序去重
+        return list(dict.fromkeys(queries))
 
     def should_use_fuzzy_search(self, processed_query: ProcessedQuery) -> bool:
         """判断是否应该使用模糊搜索"""